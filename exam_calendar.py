@@ -0,0 +1,165 @@
+"""Reading exam schedules from CSV or iCalendar files, and writing them back out as iCalendar"""
+import csv
+import hashlib
+import io
+from datetime import datetime, timezone
+
+DEFAULT_EXAM_TIME = "09:00"
+
+def parse_exam_csv(text):
+    """
+    Rows of name,date[,time] (date YYYY-MM-DD, time HH:MM, 09:00 if left out), a header row is optional
+    Returns ([(line, name, datetime), ...], [(line, error), ...])
+    """
+    rows = []
+    errors = []
+    for line, row in enumerate(csv.reader(io.StringIO(text)), start=1):
+        row = [cell.strip() for cell in row]
+        if not any(row):
+            continue
+        if line == 1 and len(row) >= 2 and row[1].lower() == "date":
+            continue
+        if len(row) < 2 or not row[0]:
+            errors.append((line, "expected name,date[,time]"))
+            continue
+        name, date = row[0], row[1]
+        exam_time = row[2] if len(row) > 2 and row[2] else DEFAULT_EXAM_TIME
+        try:
+            rows.append((line, name, datetime.strptime(f"{date} {exam_time}", "%Y-%m-%d %H:%M")))
+        except ValueError:
+            errors.append((line, f"invalid date/time '{date} {exam_time}', use YYYY-MM-DD and HH:MM"))
+    return rows, errors
+
+def _unfold(text):
+    """
+    Content lines of an iCalendar file with folded continuation lines joined back on
+    Returns [(line, content), ...] with line the file line a content line starts on
+    """
+    lines = []
+    for line, raw in enumerate(text.splitlines(), start=1):
+        if raw[:1] in (" ", "\t") and lines:
+            lines[-1] = (lines[-1][0], lines[-1][1] + raw[1:])
+        else:
+            lines.append((line, raw))
+    return lines
+
+def _unescape(value):
+    out = []
+    chars = iter(value)
+    for ch in chars:
+        if ch == "\\":
+            ch = next(chars, "")
+            out.append("\n" if ch in "nN" else ch)
+        else:
+            out.append(ch)
+    return "".join(out)
+
+def _parse_ics_datetime(params, value):
+    """DTSTART value as a naive local datetime, all-day events start at DEFAULT_EXAM_TIME"""
+    if "VALUE=DATE" in params or len(value) == 8:
+        return datetime.strptime(f"{value} {DEFAULT_EXAM_TIME}", "%Y%m%d %H:%M")
+    if value.endswith("Z"):
+        utc = datetime.strptime(value, "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc)
+        return utc.astimezone().replace(tzinfo=None)
+    # Floating or TZID times are taken as the bot's local time, like /set_exam
+    return datetime.strptime(value, "%Y%m%dT%H%M%S")
+
+def parse_ics(text):
+    """
+    Every VEVENT's SUMMARY and DTSTART
+    Returns ([(line, name, datetime), ...], [(line, error), ...]) with line the BEGIN:VEVENT line
+    """
+    rows = []
+    errors = []
+    event = None
+    for line, content in _unfold(text):
+        name, _, value = content.partition(":")
+        key, _, params = name.partition(";")
+        key = key.upper()
+        if key == "BEGIN" and value.upper() == "VEVENT":
+            event = {'line': line}
+        elif event is None:
+            continue
+        elif key == "END" and value.upper() == "VEVENT":
+            if not event.get('summary'):
+                errors.append((event['line'], "event has no SUMMARY"))
+            elif 'dtstart' not in event:
+                errors.append((event['line'], f"'{event['summary']}' has no DTSTART"))
+            else:
+                try:
+                    rows.append((event['line'], event['summary'], _parse_ics_datetime(event.get('dtstart_params', ""), event['dtstart'])))
+                except ValueError:
+                    errors.append((event['line'], f"'{event['summary']}' has an invalid DTSTART '{event['dtstart']}'"))
+            event = None
+        elif key == "SUMMARY":
+            event['summary'] = _unescape(value).strip()
+        elif key == "DTSTART":
+            event['dtstart'] = value.strip()
+            event['dtstart_params'] = params.upper()
+    return rows, errors
+
+def validate_exam_rows(rows, errors, now):
+    """
+    Drop exams in the past and repeated names (the last one wins) from parsed rows
+    Returns ({exam_key: (name, datetime)}, errors sorted by line)
+    """
+    exams = {}
+    lines = {}
+    errors = list(errors)
+    for line, name, exam_datetime in rows:
+        if len(name) > 100:
+            errors.append((line, "name is longer than 100 characters"))
+            continue
+        if exam_datetime <= now:
+            errors.append((line, f"'{name}' is in the past"))
+            continue
+        exam_key = name.lower()
+        if exam_key in exams:
+            errors.append((lines[exam_key], f"'{name}' appears again on line {line}, using the later one"))
+        exams[exam_key] = (name, exam_datetime)
+        lines[exam_key] = line
+    return exams, sorted(errors)
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+def _fold(line):
+    """Split a content line into 75 octet pieces as RFC 5545 asks"""
+    data = line.encode("utf-8")
+    if len(data) <= 75:
+        yield line
+        return
+    chunk = b""
+    first = True
+    for ch in line:
+        encoded = ch.encode("utf-8")
+        if len(chunk) + len(encoded) > (75 if first else 74):
+            yield ("" if first else " ") + chunk.decode("utf-8")
+            chunk = b""
+            first = False
+        chunk += encoded
+    yield ("" if first else " ") + chunk.decode("utf-8")
+
+def iter_ics(exams, calendar_name="IB Exams"):
+    """iCalendar lines for [(exam_key, name, datetime), ...], exam datetimes are local time"""
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    yield "BEGIN:VCALENDAR"
+    yield "VERSION:2.0"
+    yield "PRODID:-//WOSS IB Discord Bot//Exam Countdown//EN"
+    yield "CALSCALE:GREGORIAN"
+    yield from _fold(f"X-WR-CALNAME:{_escape(calendar_name)}")
+    for exam_key, name, exam_datetime in exams:
+        uid = hashlib.sha1(exam_key.encode("utf-8")).hexdigest()
+        start = exam_datetime.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        yield "BEGIN:VEVENT"
+        yield f"UID:{uid}@woss-ib-bot"
+        yield f"DTSTAMP:{stamp}"
+        yield f"DTSTART:{start}"
+        yield from _fold(f"SUMMARY:{_escape(name)}")
+        yield "END:VEVENT"
+    yield "END:VCALENDAR"
+
+def write_ics(exams, out, calendar_name="IB Exams"):
+    """Write iter_ics to a binary file object with CRLF line endings"""
+    for line in iter_ics(exams, calendar_name):
+        out.write(line.encode("utf-8") + b"\r\n")
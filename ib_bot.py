@@ -2,11 +2,32 @@ import discord
 from discord.ext import commands, tasks
 import asyncio
 import os
-from datetime import datetime, timedelta
+from datetime import datetime
 import json
 from dotenv import load_dotenv
 from discord import app_commands
+from storage import Storage, WriteBehind
+from scheduler import ExpiryScheduler
+from name_index import NameIndex
+from exam_calendar import parse_exam_csv, parse_ics, validate_exam_rows, write_ics
+import io
 import glob
+from array import array
+from bisect import bisect_left, bisect_right, insort
+import csv
+import sys
+import argparse
+import hashlib
+import mmap
+import struct
+import time
+from collections import Counter
+import heapq
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, only used to speed up batch conversions
+    np = None
 
 # Load environment variables
 load_dotenv()
@@ -17,80 +38,531 @@ intents.message_content = True
 intents.guilds = True
 intents.members = True
 
-bot = commands.Bot(command_prefix="!", intents=intents)  # Changed from None to "!"
+class IBBot(commands.Bot):
+    async def setup_hook(self):
+        # Start writing queued saves to the database
+        persistence.start()
+        # Completion DMs are sent in the background, separately from unlocking
+        start_completion_dms()
+
+    async def close(self):
+        # Make sure every queued save is written before shutting down
+        await session_scheduler.stop()
+        await exam_scheduler.stop()
+        # Send the completion DMs that are still queued while we're connected
+        await stop_completion_dms()
+        await persistence.close()
+        await super().close()
+
+bot = IBBot(command_prefix="!", intents=intents)  # Changed from None to "!"
 
-# Data storage (in production, use a proper database)
-focus_sessions = {}
+# Data storage, kept in memory and persisted to SQLite (see storage.py)
+focus_sessions = {}  # user_id -> FocusSession
+sessions_by_end = {}  # guild_id -> [(end, user_id), ...] of active sessions, kept sorted
+session_mode_counts = {}  # guild_id -> Counter of active sessions per mode
+guild_config = {}  # guild_id -> {setting: value}, see GUILD_SETTING_DEFAULTS
+session_totals = {}  # (guild_id, period) -> {user_id: {mode: [minutes, sessions]}}, see record_completed_session
 exam_dates = {}
+exams_by_time = []  # [(datetime, exam_key), ...] of exam_dates, kept sorted
+exam_name_index = NameIndex()  # exam_key -> name, for autocomplete
 resources = {}  # Store resources by subject
 
 # File paths for persistent data
 DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+DB_FILE = os.path.join(DATA_DIR, 'ib_bot.db')
+# Old JSON stores, migrated into the database on first start
 RESOURCES_FILE = os.path.join(DATA_DIR, 'resources.json')
 EXAM_DATES_FILE = os.path.join(DATA_DIR, 'exam_dates.json')
 
 # Ensure data directory exists
 os.makedirs(DATA_DIR, exist_ok=True)
 
+# Opened by open_database() when the bot starts, so the command line tools never touch it
+db = None
+
+# Lock in modes, sessions store an index into this list rather than the string
+SESSION_MODES = ['deep', 'study_group', 'physics', 'chemistry', 'biology', 'math', 'english',
+                 'french', 'spanish', 'geography', 'history', 'economics', 'business']
+
+def session_mode_code(mode):
+    """Index of mode in SESSION_MODES, unknown modes (e.g. from an older database) are appended"""
+    try:
+        return SESSION_MODES.index(mode)
+    except ValueError:
+        SESSION_MODES.append(mode)
+        return len(SESSION_MODES) - 1
+
+class FocusSession:
+    """
+    One active lock in session, kept as plain ints (ids, mode code, unix start/end seconds)
+    Members and roles are looked up from the ids when needed instead of being held here
+    """
+    __slots__ = ('user_id', 'guild_id', 'role_id', 'mode_code', 'start', 'end')
+
+    def __init__(self, user_id, guild_id, role_id, mode, start, end):
+        self.user_id = user_id
+        self.guild_id = guild_id
+        self.role_id = role_id
+        self.mode_code = session_mode_code(mode)
+        self.start = int(start)
+        self.end = int(end)
+
+    @classmethod
+    def begin(cls, user_id, guild_id, role_id, mode, duration):
+        """New session starting now and lasting duration minutes"""
+        start = int(time.time())
+        return cls(user_id, guild_id, role_id, mode, start, start + duration * 60)
+
+    @property
+    def mode(self):
+        return SESSION_MODES[self.mode_code]
+
+    @property
+    def duration(self):
+        """Planned length in minutes"""
+        return (self.end - self.start) // 60
+
+    @property
+    def start_time(self):
+        return datetime.fromtimestamp(self.start)
+
+    @property
+    def end_time(self):
+        return datetime.fromtimestamp(self.end)
+
+def session_memory_report():
+    """
+    Per-session memory use of the FocusSession records, next to the dict layout they replaced
+    (the dict figure leaves out the Member and Role objects old sessions also kept alive)
+    """
+    sessions = list(focus_sessions.values())
+    if not sessions:
+        # Measure a representative record so the report is still useful with no active sessions
+        sessions = [FocusSession.begin(2**60, 2**60, 2**60, 'deep', 480)]
+    record_bytes = 0
+    dict_bytes = 0
+    for s in sessions:
+        record_bytes += sys.getsizeof(s) + sum(sys.getsizeof(getattr(s, f)) for f in FocusSession.__slots__)
+        old = {
+            'user': None,
+            'end_time': s.end_time,
+            'mode': s.mode,
+            'duration': s.duration,
+            'role': None,
+            'user_id': s.user_id,
+            'guild_id': s.guild_id,
+            'role_id': s.role_id
+        }
+        dict_bytes += sys.getsizeof(old) + sum(sys.getsizeof(v) for v in old.values() if v is not None)
+    return {
+        'sessions': len(focus_sessions),
+        'record_bytes': record_bytes / len(sessions),
+        'dict_bytes': dict_bytes / len(sessions),
+        'total_bytes': record_bytes if focus_sessions else 0,
+    }
+
+# --- Lock in history ---
+# Every finished session is appended to the history table and added to running totals for
+# its day, its week and all time, so the leaderboard never has to rescan the history.
+# Mode '' holds the total over all modes. Only the current day and week are held in memory,
+# the database rows are updated by adding each session so older periods stay correct too.
+def session_periods(ts):
+    """(all time, day, week) period keys for unix time ts"""
+    d = datetime.fromtimestamp(ts)
+    year, week, _ = d.isocalendar()
+    return 'all', f"day:{d:%Y-%m-%d}", f"week:{year}-W{week:02d}"
+
+def record_completed_session(session_data, ended_at, ended_by):
+    """Add a finished session to the history and the running totals"""
+    end = min(int(ended_at), session_data.end)
+    minutes = max(0, (end - session_data.start) // 60)
+    persistence.append('add_session_history', (session_data.user_id, session_data.guild_id, session_data.mode,
+                                                session_data.start, end, ended_by))
+    # Drop the in-memory totals of a day or week that has ended, their rows are already queued
+    current = session_periods(time.time())
+    for key in [key for key in session_totals if key[1] not in current]:
+        del session_totals[key]
+    # Counted towards the day and week the session ended in, even if it's recorded later
+    for period in session_periods(end):
+        for mode in (session_data.mode, ''):
+            persistence.append('add_session_total', (session_data.guild_id, period, session_data.user_id, mode, minutes, 1))
+        if period not in current:
+            continue
+        modes = session_totals.setdefault((session_data.guild_id, period), {}).setdefault(session_data.user_id, {})
+        for mode in (session_data.mode, ''):
+            total = modes.setdefault(mode, [0, 0])
+            total[0] += minutes
+            total[1] += 1
+
+def session_leaderboard(guild_id, period, limit=10):
+    """[(minutes, sessions, user_id), ...] with the most minutes first"""
+    users = session_totals.get((guild_id, period), {})
+    return heapq.nlargest(limit, ((modes[''][0], modes[''][1], user_id) for user_id, modes in users.items()))
+
+def format_minutes(minutes):
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h {minutes}m" if hours else f"{minutes}m"
+
+def index_focus_session(session):
+    """Put session in focus_sessions and the per-guild end time and mode indexes"""
+    previous = focus_sessions.get(session.user_id)
+    if previous is not None:
+        unindex_focus_session(previous)
+    focus_sessions[session.user_id] = session
+    insort(sessions_by_end.setdefault(session.guild_id, []), (session.end, session.user_id))
+    session_mode_counts.setdefault(session.guild_id, Counter())[session.mode] += 1
+
+def unindex_focus_session(session):
+    del focus_sessions[session.user_id]
+    by_end = sessions_by_end[session.guild_id]
+    i = bisect_left(by_end, (session.end, session.user_id))
+    if i < len(by_end) and by_end[i] == (session.end, session.user_id):
+        del by_end[i]
+    counts = session_mode_counts[session.guild_id]
+    counts[session.mode] -= 1
+    if counts[session.mode] <= 0:
+        del counts[session.mode]
+
+def add_focus_session(session):
+    """Start tracking a new session: index, schedule its expiry and save it"""
+    index_focus_session(session)
+    session_scheduler.schedule(session.user_id, session.end)
+    save_focus_session(session.user_id)
+
+def remove_focus_session(user_id):
+    """Stop tracking a session, returns it or None if there wasn't one"""
+    session = focus_sessions.get(user_id)
+    if session is None:
+        return None
+    unindex_focus_session(session)
+    session_scheduler.cancel(user_id)
+    save_focus_session(user_id)
+    return session
+
 # Load persistent data
 def load_persistent_data():
-    """Load resources and exam dates from JSON files"""
+    """Load resources and exam dates from the database"""
     global resources, exam_dates
     
+    try:
+        migrated_resources, migrated_exams = db.migrate_json(RESOURCES_FILE, EXAM_DATES_FILE)
+        if migrated_resources or migrated_exams:
+            print(f"Migrated {migrated_resources} resources and {migrated_exams} exam dates from JSON")
+    except Exception as e:
+        print(f"Error migrating JSON data: {e}")
+    
     # Load resources
     try:
-        if os.path.exists(RESOURCES_FILE):
-            with open(RESOURCES_FILE, 'r') as f:
-                resources = json.load(f)
-                print(f"Loaded {sum(len(resources[subject]) for subject in resources)} resources")
+        resources = db.load_resources()
+        print(f"Loaded {sum(len(resources[subject]) for subject in resources)} resources")
     except Exception as e:
         print(f"Error loading resources: {e}")
         resources = {}
     
     # Load exam dates
     try:
-        if os.path.exists(EXAM_DATES_FILE):
-            with open(EXAM_DATES_FILE, 'r') as f:
-                exam_data = json.load(f)
-                # Convert datetime strings back to datetime objects
-                exam_dates = {}
-                for exam_name, data in exam_data.items():
-                    exam_dates[exam_name] = {
-                        'name': data['name'],
-                        'datetime': datetime.fromisoformat(data['datetime']),
-                        'set_by': data['set_by']
-                    }
-                print(f"Loaded {len(exam_dates)} exam dates")
+        exam_dates = db.load_exam_dates()
+        exams_by_time[:] = sorted((exam['datetime'], exam_key) for exam_key, exam in exam_dates.items())
+        for exam_key, exam in exam_dates.items():
+            exam_name_index.add(exam_key, exam['name'])
+        print(f"Loaded {len(exam_dates)} exam dates")
     except Exception as e:
         print(f"Error loading exam dates: {e}")
         exam_dates = {}
-
-def save_resources():
-    """Save resources to JSON file"""
+    
+    # Load lock in sessions as plain ids, members and roles are resolved when a session is used
     try:
-        with open(RESOURCES_FILE, 'w') as f:
-            json.dump(resources, f, indent=2)
+        for row in db.load_focus_sessions():
+            index_focus_session(FocusSession(
+                row['user_id'], row['guild_id'], row['role_id'], row['mode'], row['start_time'], row['end_time']
+            ))
+        if focus_sessions:
+            print(f"Loaded {len(focus_sessions)} lock in sessions")
     except Exception as e:
-        print(f"Error saving resources: {e}")
-
-def save_exam_dates():
-    """Save exam dates to JSON file"""
+        print(f"Error loading lock in sessions: {e}")
+    
+    # Load the running totals for all time, today and this week
+    try:
+        for row in db.load_session_totals(session_periods(time.time())):
+            modes = session_totals.setdefault((row['guild_id'], row['period']), {}).setdefault(row['user_id'], {})
+            modes[row['mode']] = [row['minutes'], row['sessions']]
+    except Exception as e:
+        print(f"Error loading lock in totals: {e}")
+    
+    # Load per guild settings
     try:
-        # Convert datetime objects to strings for JSON serialization
-        exam_data = {}
-        for exam_name, data in exam_dates.items():
-            exam_data[exam_name] = {
-                'name': data['name'],
-                'datetime': data['datetime'].isoformat(),
-                'set_by': data['set_by']
-            }
-        with open(EXAM_DATES_FILE, 'w') as f:
-            json.dump(exam_data, f, indent=2)
+        guild_config.update(db.load_guild_config())
     except Exception as e:
-        print(f"Error saving exam dates: {e}")
+        print(f"Error loading guild settings: {e}")
+
+# Saves only mark rows dirty, the WriteBehind queue writes them off the event loop.
+# Each serializer turns a dirty key into a Storage call using the current in-memory state.
+def _serialize_resource(key):
+    subject, index = key
+    return 'add_resource', (subject, dict(resources[subject][index]))
+
+def _serialize_focus_session(user_id):
+    session_data = focus_sessions.get(user_id)
+    if not session_data:
+        return 'delete_focus_session', (user_id,)
+    return 'save_focus_session', (user_id, session_data.guild_id, session_data.role_id,
+                                  session_data.mode, session_data.start, session_data.end)
+
+def _serialize_guild_setting(key):
+    guild_id, setting = key
+    if setting in guild_config.get(guild_id, {}):
+        return 'set_guild_config', (guild_id, setting, guild_config[guild_id][setting])
+    return 'delete_guild_config', (guild_id, setting)
+
+def _serialize_exam(exam_key):
+    if exam_key in exam_dates:
+        return 'set_exam', (exam_key, dict(exam_dates[exam_key]))
+    return 'remove_exam', (exam_key,)
+
+persistence = None
+
+def open_database():
+    """Open the database, set up the write-behind queue in front of it and load the saved state"""
+    global db, persistence
+    db = Storage(DB_FILE)
+    persistence = WriteBehind(db, {
+        'resource': _serialize_resource,
+        'focus_session': _serialize_focus_session,
+        'exam': _serialize_exam,
+        'guild_setting': _serialize_guild_setting,
+    })
+    load_persistent_data()
+
+def save_resource(subject, index):
+    """Queue resources[subject][index] to be saved"""
+    persistence.mark('resource', (subject, index))
+
+def save_focus_session(user_id):
+    """Queue a lock in session to be saved, or deleted if it's no longer in focus_sessions"""
+    persistence.mark('focus_session', user_id)
+
+def save_exam(exam_key):
+    """Queue an exam to be saved, or deleted if it's no longer in exam_dates"""
+    persistence.mark('exam', exam_key)
+
+# --- Guild settings ---
+# Per guild settings changed with /configure, anything a guild hasn't set uses these
+GUILD_SETTING_DEFAULTS = {
+    'admin_role': "Admins",                      # role id or name
+    'resources_channel': "1386860031512940565",  # channel id or name
+    'exam_reminders_channel': None,              # channel id, reminders aren't posted until it's set
+    'countdown_board': None,                     # "channel_id/message_id" of the live board, see /countdown_board
+}
+
+def guild_setting(guild_id, setting):
+    return guild_config.get(guild_id, {}).get(setting, GUILD_SETTING_DEFAULTS[setting])
+
+def set_guild_setting(guild_id, setting, value):
+    """Change a guild's setting, None goes back to the default"""
+    if value is None:
+        guild_config.get(guild_id, {}).pop(setting, None)
+    else:
+        guild_config.setdefault(guild_id, {})[setting] = str(value)
+    persistence.mark('guild_setting', (guild_id, setting))
+
+class GuildResolver:
+    """
+    Per-guild cache of roles by name and channels by name, so lookups don't scan guild.roles
+    A guild's maps are built on first use and dropped by the role and channel events
+    """
+
+    def __init__(self):
+        self.roles = {}     # guild_id -> {name: role}
+        self.channels = {}  # guild_id -> {name: channel}
+
+    def role(self, guild, name_or_id):
+        """Role by id (int or digit string) or by name"""
+        if str(name_or_id).isdigit():
+            return guild.get_role(int(name_or_id))
+        roles = self.roles.get(guild.id)
+        if roles is None:
+            roles = self.roles[guild.id] = {}
+            # First role with a name wins, same as discord.utils.get
+            for role in guild.roles:
+                roles.setdefault(role.name, role)
+        return roles.get(name_or_id)
+
+    def channel(self, guild, name_or_id):
+        """Channel by id (int or digit string) or by name"""
+        if str(name_or_id).isdigit():
+            return guild.get_channel(int(name_or_id))
+        channels = self.channels.get(guild.id)
+        if channels is None:
+            channels = self.channels[guild.id] = {}
+            for channel in guild.channels:
+                channels.setdefault(channel.name, channel)
+        return channels.get(name_or_id)
+
+    def invalidate_roles(self, guild_id):
+        self.roles.pop(guild_id, None)
+
+    def invalidate_channels(self, guild_id):
+        self.channels.pop(guild_id, None)
+
+guild_resolver = GuildResolver()
+
+def get_admin_role(guild):
+    return guild_resolver.role(guild, guild_setting(guild.id, 'admin_role'))
+
+def admin_role_name(guild):
+    """The admin role's current name for messages, or the setting if the role is gone"""
+    admin_role = get_admin_role(guild)
+    return admin_role.name if admin_role else guild_setting(guild.id, 'admin_role')
+
+def is_admin(member):
+    """Whether member has their guild's admin role"""
+    admin_role = get_admin_role(member.guild)
+    return admin_role is not None and member.get_role(admin_role.id) is not None
+
+# --- Exam index ---
+# Every change to exam_dates goes through store_exam/discard_exam so exams_by_time stays sorted
+def store_exam(exam_key, exam):
+    """Add or replace an exam, keeping the index in order, and queue it to be saved"""
+    if exam_key in exam_dates:
+        _unindex_exam(exam_key)
+    exam_dates[exam_key] = exam
+    insort(exams_by_time, (exam['datetime'], exam_key))
+    exam_name_index.add(exam_key, exam['name'])
+    _exam_page_cache.clear()
+    schedule_exam_events(exam_key)
+    save_exam(exam_key)
+
+def store_exams(exams):
+    """store_exam for {exam_key: exam, ...} at once, the index is re-sorted once instead of per exam"""
+    replaced = [exam_key for exam_key in exams if exam_key in exam_dates]
+    if replaced:
+        replaced_set = set(replaced)
+        exams_by_time[:] = [entry for entry in exams_by_time if entry[1] not in replaced_set]
+    exam_dates.update(exams)
+    exams_by_time.extend((exam['datetime'], exam_key) for exam_key, exam in exams.items())
+    exams_by_time.sort()
+    _exam_page_cache.clear()
+    for exam_key, exam in exams.items():
+        exam_name_index.add(exam_key, exam['name'])
+        schedule_exam_events(exam_key)
+        save_exam(exam_key)
+    return len(replaced)
 
-# Load data on startup
-load_persistent_data()
+def discard_exam(exam_key):
+    """Remove an exam and queue the deletion, returns it or None"""
+    if exam_key not in exam_dates:
+        return None
+    _unindex_exam(exam_key)
+    exam_name_index.remove(exam_key)
+    _exam_page_cache.clear()
+    cancel_exam_events(exam_key)
+    exam = exam_dates.pop(exam_key)
+    save_exam(exam_key)
+    return exam
+
+def _unindex_exam(exam_key):
+    entry = (exam_dates[exam_key]['datetime'], exam_key)
+    i = bisect_left(exams_by_time, entry)
+    if i < len(exams_by_time) and exams_by_time[i] == entry:
+        del exams_by_time[i]
+
+def first_upcoming_exam(now):
+    """Position in exams_by_time of the first exam after now, every earlier one has passed"""
+    return bisect_right(exams_by_time, (now, chr(0x10ffff)))
+
+# Exam reminders: how long before each exam to post one, e.g. EXAM_REMINDER_OFFSETS=7d,1d,1h in .env
+def parse_reminder_offsets(text):
+    """'7d,1d,1h' -> [604800, 86400, 3600] seconds, largest first"""
+    units = {'d': 86400, 'h': 3600, 'm': 60}
+    offsets = set()
+    for part in text.split(','):
+        part = part.strip().lower()
+        if not part:
+            continue
+        try:
+            offsets.add(int(part[:-1]) * units[part[-1]])
+        except (ValueError, KeyError):
+            print(f"Warning: Ignoring invalid exam reminder offset '{part}'", file=sys.stderr)
+    return sorted((offset for offset in offsets if offset > 0), reverse=True)
+
+EXAM_REMINDER_OFFSETS = parse_reminder_offsets(os.getenv('EXAM_REMINDER_OFFSETS', '7d,1d,1h'))
+
+def format_offset(seconds):
+    for unit, size in (("day", 86400), ("hour", 3600), ("minute", 60), ("second", 1)):
+        if seconds % size == 0:
+            count = seconds // size
+            return f"{count} {unit}{'s' if count != 1 else ''}"
+
+def schedule_exam_events(exam_key):
+    """
+    Put an exam's upcoming reminders on exam_scheduler as (exam_key, offset) entries,
+    plus (exam_key, 0) at the exam's start, which removes it from the countdown
+    """
+    exam_ts = exam_dates[exam_key]['datetime'].timestamp()
+    now = time.time()
+    for offset in EXAM_REMINDER_OFFSETS:
+        if exam_ts - offset > now:
+            exam_scheduler.schedule((exam_key, offset), exam_ts - offset)
+        else:
+            # Too late for this one (or the exam was moved), don't post it
+            exam_scheduler.cancel((exam_key, offset))
+    exam_scheduler.schedule((exam_key, 0), exam_ts)
+
+def cancel_exam_events(exam_key):
+    for offset in EXAM_REMINDER_OFFSETS + [0]:
+        exam_scheduler.cancel((exam_key, offset))
+
+async def exam_name_autocomplete(interaction: discord.Interaction, current: str):
+    """Exam names matching what's been typed so far, the next 25 exams when nothing has"""
+    if current.strip():
+        exam_keys = exam_name_index.search(current, 25)
+    else:
+        start = first_upcoming_exam(datetime.now())
+        exam_keys = [exam_key for _, exam_key in exams_by_time[start:start + 25]]
+    return [app_commands.Choice(name=exam_dates[k]['name'][:100], value=exam_dates[k]['name'][:100]) for k in exam_keys]
+
+def exam_suggestions(exam_name):
+    """' Did you mean: ...?' for an unknown exam name, or '' if nothing is close"""
+    matches = exam_name_index.search(exam_name, 5)
+    if not matches:
+        return ""
+    return " Did you mean: " + ", ".join(f"`{exam_dates[k]['name']}`" for k in matches) + "?"
+
+# Rendered /exam_countdown pages, only valid for the minute they were built in
+EXAM_PAGE_SIZE = 25
+_exam_page_cache = {}  # (minute, page) -> embed dict
+
+def exam_page_count():
+    return max(1, (len(exams_by_time) + EXAM_PAGE_SIZE - 1) // EXAM_PAGE_SIZE)
+
+def build_exam_page_embed(page):
+    """One page of every exam in date order, rebuilt at most once a minute"""
+    minute = int(time.time() // 60)
+    key = (minute, page)
+    payload = _exam_page_cache.get(key)
+    if payload is None:
+        if any(cached_minute != minute for cached_minute, _ in _exam_page_cache):
+            _exam_page_cache.clear()
+        embed = discord.Embed(
+            title="📅 All Exam Countdowns",
+            color=discord.Color.orange()
+        )
+        now = datetime.now()
+        start = page * EXAM_PAGE_SIZE
+        for exam_datetime, exam_key in exams_by_time[start:start + EXAM_PAGE_SIZE]:
+            time_until = exam_datetime - now
+            if time_until.total_seconds() <= 0:
+                time_text = "**EXAM TIME!**"
+            else:
+                time_text = f"{time_until.days} days remaining"
+            embed.add_field(
+                name=exam_dates[exam_key]['name'],
+                value=f"<t:{int(exam_datetime.timestamp())}:d>\n{time_text}",
+                inline=True
+            )
+        embed.set_footer(text=f"Page {page+1} of {exam_page_count()}")
+        payload = _exam_page_cache[key] = embed.to_dict()
+    return discord.Embed.from_dict(payload)
 
 # --- Load subject conversion tables from JSON files ---
 DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
@@ -113,101 +585,399 @@ SUBJECT_JSON_MAP = {
     "math_hl": "mthb.json"
 }
 
-SUBJECT_CONVERSIONS = {}
-for subject, filename in SUBJECT_JSON_MAP.items():
+# --- Master CSV importer ---
+MASTER_CSV_FILE = os.path.join(os.path.dirname(__file__), 'IB Conversions Master Document.csv')
+# Records which master CSV block each subject JSON was built from
+CONVERSIONS_MANIFEST_FILE = os.path.join(DATA_DIR, 'conversions_manifest.json')
+
+# Master document subject names that don't match the command names
+MASTER_SUBJECT_NAMES = {
+    "language & literature": "english",
+    "business management": "business",
+}
+
+def master_title_to_subject(title):
+    """Turn a master document title like 'SL Chemistry' into a subject key like 'chemistry_sl'"""
+    level, name = title.strip().split(None, 1)
+    name = name.strip().lower()
+    name = MASTER_SUBJECT_NAMES.get(name, name.replace(' ', '_'))
+    return f"{name}_{level.lower()}"
+
+def expand_marks(cell):
+    """Expand a master document cell like '67-70' or '65,66' into a list of marks"""
+    marks = []
+    for part in cell.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            low, high = (int(p) for p in part.split('-', 1))
+            marks.extend(range(low, high + 1))
+        else:
+            marks.append(int(part))
+    return marks
+
+def split_master_csv(path=MASTER_CSV_FILE):
+    """Split the master document into {title: lines}, one block per subject"""
+    blocks = {}
+    title = None
+    with open(path, newline='') as f:
+        for line in f:
+            row = next(csv.reader([line]), [])
+            if row and row[0].strip()[:3] in ("SL ", "HL ") and not any(cell.strip() for cell in row[1:]):
+                title = row[0].strip()
+                blocks[title] = []
+            if title is not None:
+                blocks[title].append(line)
+    return blocks
+
+def parse_master_block(lines):
+    """
+    Parse one subject block of the master document into the JSON table format
+    Raises ValueError if a cell can't be read or a raw mark is out of range
+    """
+    rows = list(csv.reader(lines))
+    # rows[0] is the title, rows[1] the level numbers and rows[2] the IB/OSSD header
+    ib_columns = [i for i, cell in enumerate(rows[2]) if cell.strip() == "IB"]
+    levels = {level: {} for level in range(1, len(ib_columns) + 1)}
+    seen = {}
+    for line_no, row in enumerate(rows[3:], 4):
+        for level, col in enumerate(ib_columns, 1):
+            raw_cell = row[col].strip() if col < len(row) else ''
+            ossd_cell = row[col + 1].strip() if col + 1 < len(row) else ''
+            if not raw_cell:
+                continue
+            try:
+                raw_marks = expand_marks(raw_cell)
+                converted = expand_marks(ossd_cell)
+            except ValueError:
+                raise ValueError(f"line {line_no}: can't read '{raw_cell}' / '{ossd_cell}'")
+            if not converted:
+                raise ValueError(f"line {line_no}: raw mark '{raw_cell}' has no converted mark")
+            for raw_mark in raw_marks:
+                if raw_mark not in range(0, 101) or converted[0] not in range(0, 101):
+                    raise ValueError(f"line {line_no}: '{raw_cell}' -> '{ossd_cell}' is out of range")
+                if raw_mark in seen:
+                    raise ValueError(f"line {line_no}: raw mark {raw_mark} is listed twice")
+                # Several converted marks for one cell means the lowest applies
+                levels[level][raw_mark] = converted[0]
+                seen[raw_mark] = level
+    # A raw mark of 0 is always worth 0 when the document starts at 1
+    if 0 not in seen and levels.get(1):
+        levels[1][0] = 0
+    return {
+        f"Level {level}": {str(raw_mark): marks[raw_mark] for raw_mark in sorted(marks)}
+        for level, marks in levels.items()
+    }
+
+def load_conversions_manifest():
+    """Load the importer manifest, {subject: {'title', 'file', 'hash'}}"""
     try:
-        with open(os.path.join(DATA_DIR, filename), 'r') as f:
-            SUBJECT_CONVERSIONS[subject] = json.load(f)
+        with open(CONVERSIONS_MANIFEST_FILE, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
     except Exception as e:
-        print(f"Warning: Could not load {filename} for {subject}: {e}")
+        print(f"Warning: Could not load conversions manifest: {e}", file=sys.stderr)
+        return {}
 
-# --- Conversion functions using new structure ---
-def raw_to_converted(raw_mark, subject="physics_sl"):
-    """Convert raw IB mark to converted Ontario mark using loaded JSON tables"""
-    if subject not in SUBJECT_CONVERSIONS:
-        subject = "physics_sl"
-    data = SUBJECT_CONVERSIONS[subject]
-    # Flatten all levels into one dict
-    flat = {int(k): v for level in data.values() for k, v in level.items()}
-    raw_mark = int(raw_mark)
-    if str(raw_mark) in [k for level in data.values() for k in level.keys()]:
-        # Find the value directly
-        for level in data.values():
-            if str(raw_mark) in level:
-                return level[str(raw_mark)]
-    # Interpolate if not found
-    keys = sorted(flat.keys())
-    if raw_mark <= keys[0]:
-        return flat[keys[0]]
-    if raw_mark >= keys[-1]:
-        return flat[keys[-1]]
-    for i in range(len(keys)-1):
-        if keys[i] <= raw_mark <= keys[i+1]:
-            x1, x2 = keys[i], keys[i+1]
-            y1, y2 = flat[x1], flat[x2]
-            return round(y1 + (y2-y1)*(raw_mark-x1)/(x2-x1))
-    return flat[keys[0]]
+def write_json_atomic(path, data, indent=2):
+    """Write JSON to a temporary file and rename it over path"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=indent)
+    os.replace(tmp_path, path)
 
-def raw_to_ib_level(raw_mark, subject="physics_sl"):
-    """Convert raw IB mark to IB level (1-7) using loaded JSON tables"""
-    if subject not in SUBJECT_CONVERSIONS:
-        subject = "physics_sl"
-    data = SUBJECT_CONVERSIONS[subject]
-    for level in range(7, 0, -1):
-        level_key = f"Level {level}"
-        if level_key in data and str(raw_mark) in data[level_key]:
-            return level
-    # If not found, try to infer by converted mark
-    converted = raw_to_converted(raw_mark, subject)
-    return percentage_to_ib_level(converted, subject)
+def import_master_csv(path=MASTER_CSV_FILE, force=False):
+    """
+    Rebuild the subject JSON tables from the master CSV
+    Only subjects whose CSV block changed since the last import are rewritten
+    Returns (updated, unchanged, failed) where failed maps subject -> error
+    """
+    manifest = load_conversions_manifest()
+    updated, unchanged, failed = [], [], {}
+    for title, lines in split_master_csv(path).items():
+        subject = master_title_to_subject(title)
+        block_hash = hashlib.sha256(''.join(lines).encode('utf-8')).hexdigest()
+        entry = manifest.get(subject)
+        filename = entry['file'] if entry else SUBJECT_JSON_MAP.get(subject, f"{subject}.json")
+        json_path = os.path.join(DATA_DIR, filename)
+        if not force and entry and entry['hash'] == block_hash and os.path.exists(json_path):
+            unchanged.append(subject)
+            continue
+        try:
+            table = parse_master_block(lines)
+        except ValueError as e:
+            failed[subject] = str(e)
+            continue
+        write_json_atomic(json_path, table, indent=4)
+        manifest[subject] = {'title': title, 'file': filename, 'hash': block_hash}
+        updated.append(subject)
+    if updated:
+        write_json_atomic(CONVERSIONS_MANIFEST_FILE, manifest)
+    SUBJECT_JSON_MAP.update((subject, entry['file']) for subject, entry in manifest.items())
+    return updated, unchanged, failed
 
-def percentage_to_ib_level(percentage, subject="physics_sl"):
-    """Convert Ontario percentage to IB level using loaded JSON tables"""
-    if subject not in SUBJECT_CONVERSIONS:
-        subject = "physics_sl"
-    data = SUBJECT_CONVERSIONS[subject]
-    # Find the highest level where any value in that level is <= percentage
-    for level in range(7, 0, -1):
-        level_key = f"Level {level}"
-        if level_key in data:
-            for v in data[level_key].values():
-                if percentage >= v:
-                    return level
-    return 1
+# Subjects added by the importer are picked up automatically
+SUBJECT_JSON_MAP.update((subject, entry['file']) for subject, entry in load_conversions_manifest().items())
 
-def ib_level_to_percentage(ib_level, subject="physics_sl"):
-    """Convert IB level (1-7) to minimum Ontario percentage using loaded JSON tables"""
-    if subject not in SUBJECT_CONVERSIONS:
-        subject = "physics_sl"
-    data = SUBJECT_CONVERSIONS[subject]
-    level_key = f"Level {ib_level}"
-    if level_key in data:
-        # Return the minimum percentage for this level
-        return min([int(v) for v in data[level_key].values()])
-    return 0
-
-# IB Level boundaries (converted marks) - Subject-specific
-# Based on actual WOSS IB boundaries
+class LevelIndex:
+    """Per-subject IB level thresholds, shared by every percentage <-> level lookup"""
+    __slots__ = ('minimums', 'thresholds')
+
+    def __init__(self, minimums):
+        # Minimum converted mark of each level present in the table
+        self.minimums = minimums
+        # thresholds[level-1] is the lowest percentage that reaches at least that level,
+        # kept non-decreasing so percentage lookups can bisect
+        self.thresholds = [float('inf')] * 7
+        lowest = float('inf')
+        for level in range(7, 0, -1):
+            lowest = min(lowest, self.minimums.get(level, lowest))
+            self.thresholds[level-1] = lowest
+
+    @classmethod
+    def from_table(cls, data):
+        """Build the index from a subject's JSON table"""
+        minimums = {}
+        for level in range(1, 8):
+            level_data = data.get(f"Level {level}")
+            if level_data:
+                minimums[level] = min(int(v) for v in level_data.values())
+        return cls(minimums)
+
+    def level_for_percentage(self, percentage):
+        """Highest IB level whose minimum converted mark is <= percentage"""
+        return max(bisect_right(self.thresholds, percentage), 1)
+
+    def min_percentage(self, level):
+        """Minimum converted mark for an IB level (0 if the level has no data)"""
+        return self.minimums.get(level, 0)
+
+    def level_range(self, level):
+        """(minimum, maximum) converted mark for an IB level"""
+        if level < 7:
+            return self.min_percentage(level), self.minimums.get(level + 1, 100) - 1
+        return self.min_percentage(level), 100
+
+class ConversionTable:
+    """Dense 0-100 lookup arrays compiled once from a subject's JSON table"""
+    __slots__ = ('converted', 'levels', 'index')
+
+    def __init__(self, data):
+        self.index = LevelIndex.from_table(data)
+        # Flatten all levels into one dict
+        flat = {}
+        for level_data in data.values():
+            for k, v in level_data.items():
+                flat.setdefault(int(k), v)
+        # A raw mark listed under several levels counts as the highest one
+        raw_levels = {}
+        for level in range(1, 8):
+            raw_levels.update((int(k), level) for k in data.get(f"Level {level}", {}))
+
+        keys = sorted(flat.keys())
+        self.converted = array('B')
+        self.levels = array('B')
+        for raw_mark in range(0, 101):
+            if raw_mark in flat:
+                converted = flat[raw_mark]
+            elif raw_mark <= keys[0]:
+                converted = flat[keys[0]]
+            elif raw_mark >= keys[-1]:
+                converted = flat[keys[-1]]
+            else:
+                # Interpolate between the nearest known raw marks
+                i = bisect_left(keys, raw_mark)
+                x1, x2 = keys[i-1], keys[i]
+                y1, y2 = flat[x1], flat[x2]
+                converted = round(y1 + (y2-y1)*(raw_mark-x1)/(x2-x1))
+            if raw_mark in raw_levels:
+                level = raw_levels[raw_mark]
+            else:
+                # Infer the level from the converted mark
+                level = self.index.level_for_percentage(converted)
+            self.converted.append(converted)
+            self.levels.append(level)
+
+    def convert(self, raw_mark):
+        """Converted Ontario mark for a raw mark (clamped to 0-100)"""
+        return self.converted[min(max(int(raw_mark), 0), 100)]
+
+    def level(self, raw_mark):
+        """IB level (1-7) for a raw mark (clamped to 0-100)"""
+        return self.levels[min(max(int(raw_mark), 0), 100)]
+
+    @classmethod
+    def from_packed(cls, converted, levels, minimums):
+        """Wrap already-compiled arrays (e.g. memoryviews into the packed cache)"""
+        table = cls.__new__(cls)
+        table.converted = converted
+        table.levels = levels
+        table.index = LevelIndex(minimums)
+        return table
+
+    def to_json_table(self):
+        """Rebuild the {"Level N": {raw: converted}} structure from the arrays"""
+        data = {f"Level {level}": {} for level in range(1, 8)}
+        for raw_mark in range(0, 101):
+            data[f"Level {self.levels[raw_mark]}"][str(raw_mark)] = self.converted[raw_mark]
+        return data
+
+# --- Packed binary cache of the compiled tables ---
+# Layout: header, one index entry per subject, then fixed-width table records
+PACKED_TABLES_FILE = os.path.join(DATA_DIR, 'conversions.bin')
+PACKED_MAGIC = b'WOSSCT01'
+PACKED_HEADER = struct.Struct('<8sI')         # magic, subject count
+PACKED_ENTRY = struct.Struct('<32s32sqqI')    # subject, source file, source mtime_ns, source size, record offset
+PACKED_RECORD_SIZE = 101 + 101 + 7            # converted marks, IB levels, level minimums
+PACKED_NO_LEVEL = 255                         # level minimum placeholder when a level has no data
+
+_packed_mmap = None  # kept open so the packed tables' memoryviews stay valid
+
+def _source_stat(filename):
+    """(mtime_ns, size) of a subject's JSON file, used to detect stale cache entries"""
+    st = os.stat(os.path.join(DATA_DIR, filename))
+    return st.st_mtime_ns, st.st_size
+
+def pack_conversion_tables(path=PACKED_TABLES_FILE):
+    """Compile every subject JSON and pack them into one binary file, returns the subjects packed"""
+    records = []
+    for subject, filename in SUBJECT_JSON_MAP.items():
+        try:
+            mtime_ns, size = _source_stat(filename)
+            with open(os.path.join(DATA_DIR, filename), 'r') as f:
+                table = ConversionTable(json.load(f))
+        except Exception as e:
+            print(f"Warning: Could not pack {filename} for {subject}: {e}", file=sys.stderr)
+            continue
+        minimums = bytes(table.index.minimums.get(level, PACKED_NO_LEVEL) for level in range(1, 8))
+        records.append((subject, filename, mtime_ns, size, bytes(table.converted) + bytes(table.levels) + minimums))
+
+    offset = PACKED_HEADER.size + PACKED_ENTRY.size * len(records)
+    header = [PACKED_HEADER.pack(PACKED_MAGIC, len(records))]
+    body = []
+    for i, (subject, filename, mtime_ns, size, record) in enumerate(records):
+        header.append(PACKED_ENTRY.pack(subject.encode(), filename.encode(), mtime_ns, size,
+                                        offset + i * PACKED_RECORD_SIZE))
+        body.append(record)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(b''.join(header + body))
+    os.replace(tmp_path, path)
+    return [record[0] for record in records]
+
+def load_packed_tables(path=PACKED_TABLES_FILE):
+    """
+    Memory-map the packed cache and return {subject: ConversionTable} for entries
+    whose source JSON is unchanged, stale or missing entries are left out
+    """
+    global _packed_mmap
+    try:
+        with open(path, 'rb') as f:
+            packed = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (FileNotFoundError, ValueError):
+        return {}
+    try:
+        magic, count = PACKED_HEADER.unpack_from(packed, 0)
+    except struct.error:
+        magic, count = None, 0
+    if magic != PACKED_MAGIC or len(packed) < PACKED_HEADER.size + count * (PACKED_ENTRY.size + PACKED_RECORD_SIZE):
+        print("Warning: Ignoring packed conversion tables with an unknown format", file=sys.stderr)
+        return {}
+
+    view = memoryview(packed)
+    tables = {}
+    for i in range(count):
+        subject, filename, mtime_ns, size, offset = PACKED_ENTRY.unpack_from(
+            packed, PACKED_HEADER.size + i * PACKED_ENTRY.size)
+        subject = subject.rstrip(b'\0').decode()
+        filename = filename.rstrip(b'\0').decode()
+        try:
+            if SUBJECT_JSON_MAP.get(subject) != filename or _source_stat(filename) != (mtime_ns, size):
+                continue
+        except OSError:
+            continue
+        minimums = {level: m for level, m in enumerate(view[offset + 202:offset + 209], 1) if m != PACKED_NO_LEVEL}
+        tables[subject] = ConversionTable.from_packed(view[offset:offset + 101], view[offset + 101:offset + 202], minimums)
+    _packed_mmap = packed
+    return tables
+
+def install_subject_table(subject, data, table):
+    """Swap a subject's compiled table and everything derived from it into place"""
+    SUBJECT_CONVERSIONS[subject] = data
+    CONVERSION_TABLES[subject] = table
+    IB_LEVEL_BOUNDARIES[subject] = {level: table.index.min_percentage(level) for level in range(1, 8)}
+    MIN_RAW_FOR_LEVEL[subject] = build_min_raw_index(table)
+    _embed_cache.clear()
+
+def build_min_raw_index(table):
+    """Inverse of a table: entry [level] is the lowest raw mark reaching at least that level, None if unreachable"""
+    min_raw = [None] * 8
+    for raw_mark in range(100, -1, -1):
+        for level in range(1, table.levels[raw_mark] + 1):
+            min_raw[level] = raw_mark
+    return min_raw
+
+# (mtime_ns, size) of each subject's JSON as of its last load, polled by watch_conversion_tables
+_table_sources = {}
+
+def reload_subject(subject):
+    """
+    Load one subject's JSON, compile it and swap it in
+    The table is fully built before it replaces the old one, so lookups never see a partial table
+    """
+    filename = SUBJECT_JSON_MAP[subject]
+    source = _source_stat(filename)
+    with open(os.path.join(DATA_DIR, filename), 'r') as f:
+        data = json.load(f)
+    install_subject_table(subject, data, ConversionTable(data))
+    _table_sources[subject] = source
+
+def reload_changed_tables(force=False):
+    """Reload subjects whose JSON changed since they were loaded, returns (reloaded, failed)"""
+    reloaded, failed = [], {}
+    for subject, filename in list(SUBJECT_JSON_MAP.items()):
+        try:
+            source = _source_stat(filename)
+            if not force and _table_sources.get(subject) == source:
+                continue
+            # Don't retry a broken file until it changes again
+            _table_sources[subject] = source
+            reload_subject(subject)
+            reloaded.append(subject)
+        except Exception as e:
+            failed[subject] = str(e)
+    return reloaded, failed
+
+def load_subject_conversions():
+    """Load every subject table, from the packed cache when it is fresh and from JSON otherwise"""
+    packed = load_packed_tables()
+    stale = []
+    for subject, filename in SUBJECT_JSON_MAP.items():
+        try:
+            if subject in packed:
+                _table_sources[subject] = _source_stat(filename)
+                install_subject_table(subject, packed[subject].to_json_table(), packed[subject])
+                continue
+            reload_subject(subject)
+            stale.append(subject)
+        except Exception as e:
+            print(f"Warning: Could not load {filename} for {subject}: {e}", file=sys.stderr)
+    if stale and packed:
+        print(f"Packed conversion tables are stale for {len(stale)} subject(s), run with --pack-tables to rebuild",
+              file=sys.stderr)
+
+SUBJECT_CONVERSIONS = {}
+CONVERSION_TABLES = {}
+# Lowest raw mark needed for each IB level, per subject (see build_min_raw_index)
+MIN_RAW_FOR_LEVEL = {}
+# Serialized embeds for the informational commands, keyed by (command, subject, args).
+# Every cached reply is derived from the tables, so installing a table clears it.
+_embed_cache = {}
+# IB Level boundaries (converted marks) - Subject-specific, derived from each subject's table
+# when it is loaded. "default" is used for subjects without data.
 IB_LEVEL_BOUNDARIES = {
-    "math_sl": {
-        1: 0,    # <50%
-        2: 50,   # 50-60%
-        3: 61,   # 61-71%
-        4: 72,   # 72-83%
-        5: 84,   # 84-92%
-        6: 93,   # 93-96%
-        7: 97    # 97-100%
-    },
-    "math_hl": {
-        1: 0,    # <50%
-        2: 50,   # 50-60%
-        3: 61,   # 61-71%
-        4: 72,   # 72-83%
-        5: 84,   # 84-92%
-        6: 93,   # 93-96%
-        7: 97    # 97-100%
-    },
-    # Default boundaries for other subjects (can be updated as we get more data)
     "default": {
         1: 0,    # 0% = Level 1
         2: 50,   # 50% = Level 2
@@ -218,6 +988,95 @@ IB_LEVEL_BOUNDARIES = {
         7: 97    # 97% = Level 7
     }
 }
+load_subject_conversions()
+
+def subject_display_name(subject):
+    """Turn a subject key like 'math_sl' into 'Math SL'"""
+    name, level = subject.rsplit('_', 1)
+    return f"{name.replace('_', ' ').title()} {level.upper()}"
+
+def cached_embed(key, build):
+    """Return the embed for key, building and caching it on first use"""
+    payload = _embed_cache.get(key)
+    if payload is None:
+        payload = _embed_cache[key] = build().to_dict()
+    return discord.Embed.from_dict(payload)
+
+def subject_choices():
+    """Slash command choices for every subject that has a conversion table"""
+    return [app_commands.Choice(name=subject_display_name(s), value=s) for s in CONVERSION_TABLES][:25]
+
+def get_conversion_table(subject="physics_sl"):
+    """Return the compiled table for a subject, falling back to physics_sl"""
+    if subject not in CONVERSION_TABLES:
+        subject = "physics_sl"
+    return CONVERSION_TABLES[subject]
+
+# --- Conversion functions using new structure ---
+def raw_to_converted(raw_mark, subject="physics_sl"):
+    """Convert raw IB mark to converted Ontario mark using loaded JSON tables"""
+    return get_conversion_table(subject).convert(raw_mark)
+
+def raw_to_ib_level(raw_mark, subject="physics_sl"):
+    """Convert raw IB mark to IB level (1-7) using loaded JSON tables"""
+    return get_conversion_table(subject).level(raw_mark)
+
+def convert_batch(raw_marks, subject="physics_sl"):
+    """
+    Convert many raw marks for one subject in a single pass
+    raw_marks: NumPy array or any iterable of raw marks
+    Returns (converted_marks, ib_levels) as NumPy arrays when numpy is installed, lists otherwise
+    """
+    table = get_conversion_table(subject)
+    if np is not None:
+        if isinstance(raw_marks, (np.ndarray, list, tuple)):
+            idx = np.asarray(raw_marks, dtype=np.int64)
+        else:
+            # Generators and other one-pass iterables can't go through asarray
+            idx = np.fromiter(raw_marks, dtype=np.int64)
+        idx = np.clip(idx, 0, 100)
+        converted = np.frombuffer(table.converted, dtype=np.uint8)[idx]
+        levels = np.frombuffer(table.levels, dtype=np.uint8)[idx]
+        return converted, levels
+    idx = [min(max(int(raw_mark), 0), 100) for raw_mark in raw_marks]
+    return [table.converted[i] for i in idx], [table.levels[i] for i in idx]
+
+def percentage_to_ib_level(percentage, subject="physics_sl"):
+    """Convert Ontario percentage to IB level using loaded JSON tables"""
+    return get_conversion_table(subject).index.level_for_percentage(percentage)
+
+def ib_level_to_percentage(ib_level, subject="physics_sl"):
+    """Convert IB level (1-7) to minimum Ontario percentage using loaded JSON tables"""
+    return get_conversion_table(subject).index.min_percentage(ib_level)
+
+def min_raw_for_level(subject, level):
+    """Lowest raw mark that reaches at least the given IB level, None if no mark does"""
+    return MIN_RAW_FOR_LEVEL[subject][level]
+
+def solve_target_plan(subjects, target_total, min_level=3):
+    """
+    Cheapest set of IB levels whose sum reaches target_total
+    Cost is the total raw marks needed, using the precomputed inverse tables
+    Every subject gets at least min_level so the plan also passes the diploma rules
+    Returns {subject: level}, or None if the total can't be reached
+    """
+    # best[points] = (total raw marks, levels chosen so far) for the subjects handled so far
+    best = {0: (0, [])}
+    for subject in subjects:
+        options = [(level, min_raw_for_level(subject, level)) for level in range(min_level, 8)]
+        step = {}
+        for points, (cost, levels) in best.items():
+            for level, raw_mark in options:
+                if raw_mark is None:
+                    continue
+                # Points past the target don't help, so cap them to keep the table small
+                new_points = min(points + level, target_total)
+                if new_points not in step or cost + raw_mark < step[new_points][0]:
+                    step[new_points] = (cost + raw_mark, levels + [level])
+        best = step
+    if target_total not in best:
+        return None
+    return dict(zip(subjects, best[target_total][1]))
 
 @bot.event
 async def on_ready():
@@ -244,10 +1103,24 @@ async def on_ready():
         print(f"❌ Failed to sync commands: {e}")
         print(f"Error type: {type(e).__name__}")
     
-    # Start the focus session checker
-    check_focus_sessions.start()
-    # Start exam countdown updater
-    update_exam_countdowns.start()
+    # End sessions that expired while the bot was offline, then schedule the rest
+    await reconcile_focus_sessions()
+    for user_id, session_data in focus_sessions.items():
+        # Sessions reconcile couldn't unlock already have a retry scheduled
+        if user_id not in session_scheduler:
+            session_scheduler.schedule(user_id, session_data.end)
+    session_scheduler.start()
+    # Schedule exam reminders, exams that passed while offline are removed straight away
+    for exam_key in list(exam_dates):
+        schedule_exam_events(exam_key)
+    exam_scheduler.start()
+    # on_ready runs again after every reconnect, and starting a running loop raises
+    # Start conversion table hot reload
+    if not watch_conversion_tables.is_running():
+        watch_conversion_tables.start()
+    # Start keeping the live countdown boards up to date
+    if not update_countdown_boards.is_running():
+        update_countdown_boards.start()
 
 @bot.tree.error
 async def on_app_command_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
@@ -284,6 +1157,36 @@ async def on_message(message):
     # This prevents the prefix errors
     pass
 
+# Keep guild_resolver in step with the guild's roles and channels
+@bot.event
+async def on_guild_role_create(role):
+    guild_resolver.invalidate_roles(role.guild.id)
+
+@bot.event
+async def on_guild_role_update(before, after):
+    guild_resolver.invalidate_roles(after.guild.id)
+
+@bot.event
+async def on_guild_role_delete(role):
+    guild_resolver.invalidate_roles(role.guild.id)
+
+@bot.event
+async def on_guild_channel_create(channel):
+    guild_resolver.invalidate_channels(channel.guild.id)
+
+@bot.event
+async def on_guild_channel_update(before, after):
+    guild_resolver.invalidate_channels(after.guild.id)
+
+@bot.event
+async def on_guild_channel_delete(channel):
+    guild_resolver.invalidate_channels(channel.guild.id)
+
+@bot.event
+async def on_guild_remove(guild):
+    guild_resolver.invalidate_roles(guild.id)
+    guild_resolver.invalidate_channels(guild.id)
+
 # Lock In Mode Commands (changed from focus)
 @bot.tree.command(name="lockin", description="Start a lock in session (duration in minutes)")
 @app_commands.describe(
@@ -324,7 +1227,7 @@ async def lockin_start(interaction: discord.Interaction, duration: int, mode: st
     
     # Create or get focus role
     focus_role_name = f"🔒 Locked In ({mode.title()})"
-    focus_role = discord.utils.get(guild.roles, name=focus_role_name)
+    focus_role = guild_resolver.role(guild, focus_role_name)
     # If the role does not exist, do not create it (commented out)
     # if not focus_role:
     #     try:
@@ -348,14 +1251,9 @@ async def lockin_start(interaction: discord.Interaction, duration: int, mode: st
         return
     
     # Store focus session data
-    end_time = datetime.now() + timedelta(minutes=duration)
-    focus_sessions[user_id] = {
-        'end_time': end_time,
-        'role': focus_role,
-        'mode': mode,
-        'duration': duration,
-        'user': interaction.user
-    }
+    session = FocusSession.begin(user_id, guild.id, focus_role.id, mode, duration)
+    add_focus_session(session)
+    end_time = session.end_time
     
     embed = discord.Embed(
         title="🔒 Locked In Activated!",
@@ -375,8 +1273,6 @@ async def lockin_start(interaction: discord.Interaction, duration: int, mode: st
 async def unlock(interaction: discord.Interaction):
     """Request to end the current lock in session (admin approval required)"""
     user_id = interaction.user.id
-    guild = interaction.guild
-    admin_role = discord.utils.get(guild.roles, name="Admins")
     if user_id not in focus_sessions:
         await interaction.response.send_message("❌ You're not currently in a lock in session.", ephemeral=False)
         return
@@ -391,8 +1287,7 @@ async def unlock(interaction: discord.Interaction):
 
         async def interaction_check(self, button_interaction: discord.Interaction) -> bool:
             # Only allow admins to press the buttons
-            admin_role = discord.utils.get(button_interaction.guild.roles, name="Admins")
-            if admin_role and admin_role in button_interaction.user.roles:
+            if is_admin(button_interaction.user):
                 return True
             await button_interaction.response.send_message("❌ Only admins can approve or refuse this request.", ephemeral=True)
             return False
@@ -401,14 +1296,16 @@ async def unlock(interaction: discord.Interaction):
         async def confirm(self, button_interaction: discord.Interaction, button: discord.ui.Button):
             session_data = focus_sessions.get(self.target_user.id)
             if session_data:
+                role = button_interaction.guild.get_role(session_data.role_id)
                 try:
-                    await self.target_user.remove_roles(session_data['role'], reason="Lock in session ended by admin approval")
+                    if role:
+                        await self.target_user.remove_roles(role, reason="Lock in session ended by admin approval")
                 except discord.Forbidden:
                     pass
-                started_time = session_data['end_time'] - timedelta(minutes=session_data['duration'])
-                actual_duration = datetime.now() - started_time
+                actual_duration = datetime.now() - session_data.start_time
                 actual_minutes = int(actual_duration.total_seconds() / 60)
-                del focus_sessions[self.target_user.id]
+                remove_focus_session(self.target_user.id)
+                record_completed_session(session_data, time.time(), 'admin')
                 embed = discord.Embed(
                     title="✅ Lock In Session Ended (Admin Confirmed)",
                     description=f"{self.target_user.mention}'s lock in session has been ended by {button_interaction.user.mention} (admin).\nGreat work! You were locked in for **{actual_minutes} minutes**.",
@@ -416,7 +1313,7 @@ async def unlock(interaction: discord.Interaction):
                 )
                 embed.add_field(
                     name="Session Stats:",
-                    value=f"**Planned:** {session_data['duration']} minutes\n**Actual:** {actual_minutes} minutes\n**Mode:** {session_data['mode'].title()}",
+                    value=f"**Planned:** {session_data.duration} minutes\n**Actual:** {actual_minutes} minutes\n**Mode:** {session_data.mode.title()}",
                     inline=False
                 )
                 embed.set_footer(text="Keep up the great work! 🌟")
@@ -442,7 +1339,7 @@ async def unlock(interaction: discord.Interaction):
     )
     embed.add_field(
         name="Session Info:",
-        value=f"**Mode:** {session_data['mode'].title()}\n**Planned Duration:** {session_data['duration']} minutes\n**Ends at:** <t:{int(session_data['end_time'].timestamp())}:t>",
+        value=f"**Mode:** {session_data.mode.title()}\n**Planned Duration:** {session_data.duration} minutes\n**Ends at:** <t:{int(session_data.end_time.timestamp())}:t>",
         inline=False
     )
     embed.set_footer(text="Only admins can approve or refuse this request.")
@@ -459,7 +1356,7 @@ async def lockin_status(interaction: discord.Interaction):
         return
     
     session_data = focus_sessions[user_id]
-    end_time = session_data['end_time']
+    end_time = session_data.end_time
     time_remaining = end_time - datetime.now()
     
     if time_remaining.total_seconds() <= 0:
@@ -470,67 +1367,131 @@ async def lockin_status(interaction: discord.Interaction):
     
     embed = discord.Embed(
         title="🎯 Lock In Session Status",
-        description=f"**Time Remaining:** {minutes_remaining} minutes\n**Ends at:** <t:{int(end_time.timestamp())}:t>\n**Mode:** {session_data['mode'].title()}",
+        description=f"**Time Remaining:** {minutes_remaining} minutes\n**Ends at:** <t:{int(end_time.timestamp())}:t>\n**Mode:** {session_data.mode.title()}",
         color=discord.Color.red()
     )
     
     await interaction.response.send_message(embed=embed, ephemeral=True)
 
-@bot.tree.command(name="lockin_list", description="Show all users currently Locked In")
-async def lockin_list(interaction: discord.Interaction):
-    """Show all users currently Locked In"""
-    if not focus_sessions:
-        embed = discord.Embed(
+LOCKIN_LIST_PAGE_SIZE = 12
+
+def build_lockin_list_embed(guild, page):
+    """Render one page of the guild's active sessions from the end time index, soonest first"""
+    by_end = sessions_by_end.get(guild.id, [])
+    # Sessions the scheduler hasn't ended yet are still in the index, skip them
+    first = bisect_right(by_end, (time.time(), float('inf')))
+    active = len(by_end) - first
+    if not active:
+        return discord.Embed(
             title="🔒 Locked In Status",
             description="No users are currently Locked In.",
             color=discord.Color.blue()
-        )
-        await interaction.response.send_message(embed=embed)
-        return
-    
+        ), 0
+    pages = (active + LOCKIN_LIST_PAGE_SIZE - 1) // LOCKIN_LIST_PAGE_SIZE
+    page = max(0, min(page, pages - 1))
+    counts = session_mode_counts.get(guild.id, {})
     embed = discord.Embed(
         title="🔒 Users Locked In",
+        description=" · ".join(f"**{mode.title()}:** {n}" for mode, n in sorted(counts.items(), key=lambda c: -c[1])),
         color=discord.Color.orange()
     )
-    
-    current_time = datetime.now()
-    active_sessions = []
-    
-    for user_id, session_data in focus_sessions.items():
-        time_remaining = session_data['end_time'] - current_time
-        
-        if time_remaining.total_seconds() > 0:
-            minutes_remaining = int(time_remaining.total_seconds() / 60)
-            user = session_data['user']
-            mode = session_data['mode'].title()
-            
-            active_sessions.append({
-                'user': user,
-                'minutes_remaining': minutes_remaining,
-                'mode': mode,
-                'end_time': session_data['end_time']
-            })
-    
-    if not active_sessions:
-        embed.description = "No active lock in sessions found."
+    now = time.time()
+    start = first + page * LOCKIN_LIST_PAGE_SIZE
+    for end, user_id in by_end[start:start + LOCKIN_LIST_PAGE_SIZE]:
+        # Only use cached members here, sessions restored after a restart may not be cached yet
+        user = guild.get_member(user_id)
+        embed.add_field(
+            name=f"👤 {user.display_name if user else f'User {user_id}'}",
+            value=f"**Mode:** {focus_sessions[user_id].mode.title()}\n**Time Left:** {int((end - now) / 60)} minutes\n**Ends:** <t:{end}:t>",
+            inline=True
+        )
+    embed.set_footer(text=f"Total active sessions: {active} · Page {page + 1}/{pages}")
+    return embed, pages
+
+class LockinListView(discord.ui.View):
+    """Previous/next buttons for /lockin_list, each press renders just the new page"""
+
+    def __init__(self, guild, pages, timeout=180):
+        super().__init__(timeout=timeout)
+        self.guild = guild
+        self.page = 0
+        self.pages = pages
+        self.update_buttons()
+
+    def update_buttons(self):
+        self.previous.disabled = self.page <= 0
+        self.next.disabled = self.page >= self.pages - 1
+
+    async def show(self, interaction, page):
+        embed, self.pages = build_lockin_list_embed(self.guild, page)
+        self.page = max(0, min(page, self.pages - 1))
+        self.update_buttons()
+        await interaction.response.edit_message(embed=embed, view=self)
+
+    @discord.ui.button(label="◀", style=discord.ButtonStyle.grey)
+    async def previous(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.show(interaction, self.page - 1)
+
+    @discord.ui.button(label="▶", style=discord.ButtonStyle.grey)
+    async def next(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.show(interaction, self.page + 1)
+
+@bot.tree.command(name="lockin_list", description="Show all users currently Locked In")
+async def lockin_list(interaction: discord.Interaction):
+    """Show all users currently Locked In, a page at a time"""
+    embed, pages = build_lockin_list_embed(interaction.guild, 0)
+    if pages > 1:
+        await interaction.response.send_message(embed=embed, view=LockinListView(interaction.guild, pages))
     else:
-        # Sort by time remaining (shortest first)
-        active_sessions.sort(key=lambda x: x['minutes_remaining'])
-        
-        for session in active_sessions:
-            user = session['user']
-            minutes = session['minutes_remaining']
-            mode = session['mode']
-            end_time = session['end_time']
-            
-            embed.add_field(
-                name=f"👤 {user.display_name}",
-                value=f"**Mode:** {mode}\n**Time Left:** {minutes} minutes\n**Ends:** <t:{int(end_time.timestamp())}:t>",
-                inline=True
-            )
-    
-    embed.set_footer(text=f"Total active sessions: {len(active_sessions)}")
-    
+        await interaction.response.send_message(embed=embed)
+
+@bot.tree.command(name="lockin_leaderboard", description="Show who has been Locked In the longest")
+@app_commands.describe(period="Time period to rank")
+@app_commands.choices(period=[
+    app_commands.Choice(name="Today", value=1),
+    app_commands.Choice(name="This Week", value=2),
+    app_commands.Choice(name="All Time", value=0),
+])
+async def lockin_leaderboard(interaction: discord.Interaction, period: int = 2):
+    """Rank members by completed lock in time"""
+    period_name = {0: "All Time", 1: "Today", 2: "This Week"}[period]
+    ranking = session_leaderboard(interaction.guild.id, session_periods(time.time())[period])
+    embed = discord.Embed(
+        title=f"🏆 Lock In Leaderboard ({period_name})",
+        color=discord.Color.gold()
+    )
+    if not ranking:
+        embed.description = "No completed lock in sessions yet."
+    else:
+        lines = []
+        for rank, (minutes, sessions, user_id) in enumerate(ranking, start=1):
+            user = interaction.guild.get_member(user_id)
+            name = user.display_name if user else f"User {user_id}"
+            lines.append(f"**{rank}.** {name} - {format_minutes(minutes)} ({sessions} session{'s' if sessions != 1 else ''})")
+        embed.description = "\n".join(lines)
+    await interaction.response.send_message(embed=embed)
+
+@bot.tree.command(name="lockin_stats", description="Show lock in totals for you or another member")
+@app_commands.describe(member="Member to show (defaults to you)")
+async def lockin_stats(interaction: discord.Interaction, member: discord.Member = None):
+    """Show a member's completed lock in time for today, this week and all time"""
+    member = member or interaction.user
+    periods = session_periods(time.time())
+    totals = [session_totals.get((interaction.guild.id, period), {}).get(member.id, {}) for period in periods]
+    embed = discord.Embed(
+        title=f"📈 Lock In Stats for {member.display_name}",
+        color=discord.Color.blue()
+    )
+    for name, index in (("Today", 1), ("This Week", 2), ("All Time", 0)):
+        minutes, sessions = totals[index].get('', [0, 0])
+        embed.add_field(name=f"{name}:", value=f"**Time:** {format_minutes(minutes)}\n**Sessions:** {sessions}", inline=True)
+    by_mode = sorted(((total[0], mode) for mode, total in totals[0].items() if mode), reverse=True)
+    if by_mode:
+        embed.add_field(
+            name="By Mode (All Time):",
+            value="\n".join(f"**{mode.title()}:** {format_minutes(minutes)}" for minutes, mode in by_mode),
+            inline=False
+        )
     await interaction.response.send_message(embed=embed)
 
 # IB Score Conversion Commands
@@ -602,86 +1563,31 @@ async def raw_to_converted_cmd(interaction: discord.Interaction, raw_mark: int,
 )
 @app_commands.choices(subject=[
     app_commands.Choice(name="General (Default)", value="default"),
-    app_commands.Choice(name="Math SL", value="math_sl"),
-    app_commands.Choice(name="Math HL", value="math_hl"),
-    app_commands.Choice(name="Physics SL", value="physics_sl"),
-    app_commands.Choice(name="Physics HL", value="physics_hl"),
-    app_commands.Choice(name="Chemistry SL", value="chemistry_sl"),
-    app_commands.Choice(name="Chemistry HL", value="chemistry_hl"),
-    app_commands.Choice(name="Biology SL", value="biology_sl"),
-    app_commands.Choice(name="Biology HL", value="biology_hl"),
-    app_commands.Choice(name="English SL", value="english_sl"),
-    app_commands.Choice(name="English HL", value="english_hl"),
-    app_commands.Choice(name="French SL", value="french_sl"),
-    app_commands.Choice(name="French HL", value="fif.json"),
-    app_commands.Choice(name="Spanish SL", value="esp.json"),
-    app_commands.Choice(name="Geography SL", value="geo.json"),
-    app_commands.Choice(name="Geography HL", value="geo.json"),
-    app_commands.Choice(name="History SL", value="bbb.json"),
-    app_commands.Choice(name="History HL", value="bbb.json"),
-    app_commands.Choice(name="Economics SL", value="econ.json"),
-    app_commands.Choice(name="Economics HL", value="econ.json"),
-])
+] + subject_choices()[:24])
 async def ib_to_percent(interaction: discord.Interaction, ib_grade: int, subject: str = "default"):
     """Convert IB grade (1-7) to percentage using JSON data if available"""
     if ib_grade not in range(1, 8):
         await interaction.response.send_message("❌ IB grades must be between 1 and 7.", ephemeral=True)
         return
-    
-    # Use JSON data if available
-    if subject in SUBJECT_CONVERSIONS:
-        data = SUBJECT_CONVERSIONS[subject]
-        level_key = f"Level {ib_grade}"
-        if level_key in data:
-            # Get all percentages for this level and use the minimum
-            percentages = [int(v) for v in data[level_key].values()]
-            if percentages:
-                percentage = min(percentages)
-                # Find the next level's minimum for the range
-                if ib_grade < 7:
-                    next_level_key = f"Level {ib_grade+1}"
-                    if next_level_key in data:
-                        next_percentages = [int(v) for v in data[next_level_key].values()]
-                        if next_percentages:
-                            next_level_min = min(next_percentages)
-                        else:
-                            next_level_min = 100
-                    else:
-                        next_level_min = 100
-                    range_text = f"**{percentage}% - {next_level_min-1}%**"
-                else:
-                    range_text = f"**{percentage}% - 100%**"
-                subject_name = subject.replace('_', ' ').title()
-    embed = discord.Embed(
-        title="📊 IB Grade Conversion",
-        description=f"**IB Grade {ib_grade}** = **{percentage}%** (minimum)\n**Subject:** {subject_name}",
-        color=discord.Color.blue()
-    )
-    embed.add_field(
-        name="Level Range:",
-        value=range_text,
-        inline=False
-        )
-    embed.add_field(
-        name="Note:",
-        value="This shows the minimum converted percentage required for each IB level. Actual raw marks vary by subject.",
-        inline=False
-    )
-    await interaction.response.send_message(embed=embed)
-    return
-    # Fallback to default boundaries
-    if subject in IB_LEVEL_BOUNDARIES:
-        boundaries = IB_LEVEL_BOUNDARIES[subject]
+    
+    await interaction.response.send_message(embed=cached_embed(("ib_to_percent", subject, ib_grade), lambda: build_ib_to_percent_embed(ib_grade, subject)))
+
+def build_ib_to_percent_embed(ib_grade, subject):
+    """Build the /ib_to_percent reply"""
+    # Use JSON data if available, otherwise fall back to default boundaries
+    if subject in CONVERSION_TABLES:
+        percentage, max_percent = CONVERSION_TABLES[subject].index.level_range(ib_grade)
         subject_name = subject.replace('_', ' ').title()
     else:
-        boundaries = IB_LEVEL_BOUNDARIES["default"]
-        subject_name = "General"
-    percentage = boundaries[ib_grade]
-    if ib_grade < 7:
-        next_level_min = boundaries[ib_grade + 1]
-        range_text = f"**{percentage}% - {next_level_min - 1}%**"
-    else:
-        range_text = f"**{percentage}% - 100%**"
+        if subject in IB_LEVEL_BOUNDARIES:
+            boundaries = IB_LEVEL_BOUNDARIES[subject]
+            subject_name = subject.replace('_', ' ').title()
+        else:
+            boundaries = IB_LEVEL_BOUNDARIES["default"]
+            subject_name = "General"
+        percentage = boundaries[ib_grade]
+        max_percent = boundaries[ib_grade + 1] - 1 if ib_grade < 7 else 100
+    range_text = f"**{percentage}% - {max_percent}%**"
     embed = discord.Embed(
         title="📊 IB Grade Conversion",
         description=f"**IB Grade {ib_grade}** = **{percentage}%** (minimum)\n**Subject:** {subject_name}",
@@ -697,34 +1603,17 @@ async def ib_to_percent(interaction: discord.Interaction, ib_grade: int, subject
         value="This shows the minimum converted percentage required for each IB level. Actual raw marks vary by subject.",
         inline=False
     )
-    await interaction.response.send_message(embed=embed)
+    return embed
 
 @bot.tree.command(name="subject_conversion", description="Show conversion table for a specific subject")
 @app_commands.describe(subject="Choose the subject")
-@app_commands.choices(subject=[
-    app_commands.Choice(name="Physics SL", value="physics_sl"),
-    app_commands.Choice(name="Physics HL", value="physics_hl"),
-    app_commands.Choice(name="Chemistry SL", value="chemistry_sl"),
-    app_commands.Choice(name="Chemistry HL", value="chemistry_hl"),
-    app_commands.Choice(name="Biology SL", value="biology_sl"),
-    app_commands.Choice(name="Biology HL", value="biology_hl"),
-    app_commands.Choice(name="Math SL", value="math_sl"),
-    app_commands.Choice(name="Math HL", value="math_hl"),
-    app_commands.Choice(name="English SL", value="english_sl"),
-    app_commands.Choice(name="English HL", value="english_hl"),
-    app_commands.Choice(name="French SL", value="french_sl"),
-    app_commands.Choice(name="French HL", value="french_hl"),
-    app_commands.Choice(name="Spanish SL", value="spanish_sl"),
-    app_commands.Choice(name="Geography SL", value="geography_sl"),
-    app_commands.Choice(name="Geography HL", value="geography_hl"),
-    app_commands.Choice(name="History SL", value="history_sl"),
-    app_commands.Choice(name="History HL", value="history_hl"),
-    app_commands.Choice(name="Economics SL", value="economics_sl"),
-    app_commands.Choice(name="Economics HL", value="economics_hl"),
-    app_commands.Choice(name="Business Management SL", value="business_sl"),
-])
+@app_commands.choices(subject=subject_choices())
 async def subject_conversion(interaction: discord.Interaction, subject: str):
     """Show the conversion table for a specific subject"""
+    await interaction.response.send_message(embed=cached_embed(("subject_conversion", subject), lambda: build_subject_conversion_embed(subject)))
+
+def build_subject_conversion_embed(subject):
+    """Build the /subject_conversion reply"""
     # Get the appropriate boundaries for the subject
     if subject in IB_LEVEL_BOUNDARIES:
         boundaries = IB_LEVEL_BOUNDARIES[subject]
@@ -754,82 +1643,143 @@ async def subject_conversion(interaction: discord.Interaction, subject: str):
     )
     
     embed.set_footer(text="Based on WOSS IB conversion tables")
-    
-    await interaction.response.send_message(embed=embed)
+    return embed
 
 @bot.tree.command(name="list_subjects", description="List all available subjects for conversion")
 async def list_subjects(interaction: discord.Interaction):
     """List all available subjects for grade conversion"""
+    await interaction.response.send_message(embed=cached_embed(("list_subjects",), build_list_subjects_embed))
+
+# Subject groups shown by /list_subjects: (field name, keywords matched against subject keys)
+SUBJECT_GROUPS = [
+    ("🔬 Sciences", ['physics', 'chemistry', 'biology']),
+    ("📖 Languages", ['english', 'french', 'spanish']),
+    ("🌍 Humanities", ['geography', 'history', 'economics']),
+    ("📊 Business", ['business']),
+    ("📐 Mathematics", ['math']),
+]
+
+def build_list_subjects_embed():
+    """Build the /list_subjects reply"""
     embed = discord.Embed(
         title="📚 Available Subjects",
         description="Use these subject names with conversion commands:",
         color=discord.Color.purple()
     )
     
-    # Group subjects by type
-    sciences = [s for s in SUBJECT_CONVERSIONS.keys() if any(subj in s for subj in ['physics', 'chemistry', 'biology'])]
-    languages = [s for s in SUBJECT_CONVERSIONS.keys() if any(subj in s for subj in ['english', 'french', 'spanish'])]
-    humanities = [s for s in SUBJECT_CONVERSIONS.keys() if any(subj in s for subj in ['geography', 'history', 'economics'])]
-    business = [s for s in SUBJECT_CONVERSIONS.keys() if any(subj in s for subj in ['business'])]
-    math = [s for s in SUBJECT_CONVERSIONS.keys() if 'math' in s]
+    # Group subjects by type in one pass over the loaded subjects
+    groups = {name: [] for name, _ in SUBJECT_GROUPS}
+    for s in sorted(SUBJECT_CONVERSIONS.keys()):
+        for name, keywords in SUBJECT_GROUPS:
+            if any(subj in s for subj in keywords):
+                groups[name].append(s)
     
-    embed.add_field(
-        name="🔬 Sciences",
-        value="\n".join([f"• `{s}`" for s in sorted(sciences)]),
-        inline=True
-    )
-    embed.add_field(
-        name="📖 Languages",
-        value="\n".join([f"• `{s}`" for s in sorted(languages)]),
-        inline=True
-    )
-    embed.add_field(
-        name="🌍 Humanities",
-        value="\n".join([f"• `{s}`" for s in sorted(humanities)]),
-        inline=True
-    )
-    embed.add_field(
-        name="📊 Business",
-        value="\n".join([f"• `{s}`" for s in sorted(business)]),
-        inline=True
-    )
-    embed.add_field(
-        name="📐 Mathematics",
-        value="\n".join([f"• `{s}`" for s in sorted(math)]),
-        inline=True
-    )
+    for name, subjects in groups.items():
+        embed.add_field(
+            name=name,
+            value="\n".join([f"• `{s}`" for s in subjects]),
+            inline=True
+        )
     
     embed.set_footer(text="Use /raw_to_converted <mark> <subject> to convert your marks")
-    
-    await interaction.response.send_message(embed=embed)
+    return embed
+
+def parse_grade_distribution(text, low, high):
+    """
+    Parse a grade like '5', a range like '5-6' (equally likely) or probabilities like '5:0.3, 6:0.7'
+    Returns {grade: probability}, raises ValueError if the text is invalid or outside low-high
+    """
+    text = text.strip().replace('–', '-').replace('—', '-')
+    if ':' in text or '=' in text:
+        dist = {}
+        for part in text.split(','):
+            grade, _, prob = part.replace('=', ':').partition(':')
+            prob = prob.strip()
+            prob = float(prob[:-1]) / 100 if prob.endswith('%') else float(prob)
+            if prob < 0:
+                raise ValueError
+            dist[int(grade)] = dist.get(int(grade), 0) + prob
+        weight = sum(dist.values())
+        if weight <= 0:
+            raise ValueError
+        # Normalize so probabilities that don't quite add up to 1 still work
+        dist = {grade: prob / weight for grade, prob in dist.items()}
+    elif '-' in text.lstrip('-'):
+        first, last = (int(g) for g in text.split('-', 1))
+        if first > last:
+            first, last = last, first
+        dist = {grade: 1 / (last - first + 1) for grade in range(first, last + 1)}
+    else:
+        dist = {int(text): 1.0}
+    if any(grade not in range(low, high + 1) for grade in dist):
+        raise ValueError
+    return dist
+
+def convolve(a, b):
+    """Distribution of the sum of two independent {value: probability} distributions"""
+    result = {}
+    for x, px in a.items():
+        for y, py in b.items():
+            result[x + y] = result.get(x + y, 0) + px * py
+    return result
+
+def diploma_distribution(subject_dists, bonus_dist):
+    """
+    Distribution of the diploma total and the probability the diploma is awarded
+    Convolves one subject at a time instead of enumerating every combination of grades
+    Returns ({total: probability}, probability awarded)
+    """
+    subject_totals = {0: 1.0}
+    # Same convolution but only over grades >= 3, so it carries P(all >= 3 and subject total = s)
+    passing_totals = {0: 1.0}
+    for dist in subject_dists:
+        subject_totals = convolve(subject_totals, dist)
+        passing_totals = convolve(passing_totals, {g: p for g, p in dist.items() if g >= 3})
+    totals = convolve(subject_totals, bonus_dist)
+    awarded = sum(
+        p * pb
+        for s, p in passing_totals.items() if s >= 12
+        for b, pb in bonus_dist.items() if s + b >= 24
+    )
+    return totals, awarded
 
 @bot.tree.command(name="calculate_total", description="Calculate total IB score from individual grades")
 @app_commands.describe(
-    subject1="IB grade for subject 1 (1-7)",
-    subject2="IB grade for subject 2 (1-7)",
-    subject3="IB grade for subject 3 (1-7)",
-    subject4="IB grade for subject 4 (1-7)",
-    subject5="IB grade for subject 5 (1-7)",
-    subject6="IB grade for subject 6 (1-7)",
-    tok_ee_bonus="TOK/EE bonus points (0-3, optional)"
+    subject1="IB grade for subject 1 (1-7, a range like 5-6, or odds like 5:0.3,6:0.7)",
+    subject2="IB grade for subject 2 (1-7, a range like 5-6, or odds like 5:0.3,6:0.7)",
+    subject3="IB grade for subject 3 (1-7, a range like 5-6, or odds like 5:0.3,6:0.7)",
+    subject4="IB grade for subject 4 (1-7, a range like 5-6, or odds like 5:0.3,6:0.7)",
+    subject5="IB grade for subject 5 (1-7, a range like 5-6, or odds like 5:0.3,6:0.7)",
+    subject6="IB grade for subject 6 (1-7, a range like 5-6, or odds like 5:0.3,6:0.7)",
+    tok_ee_bonus="TOK/EE bonus points (0-3 or a range like 1-2, optional)"
 )
 async def calculate_total(interaction: discord.Interaction, 
-                         subject1: int, subject2: int, subject3: int, 
-                         subject4: int, subject5: int, subject6: int,
-                         tok_ee_bonus: int = 0):
+                         subject1: str, subject2: str, subject3: str, 
+                         subject4: str, subject5: str, subject6: str,
+                         tok_ee_bonus: str = "0"):
     """Calculate total IB diploma score"""
-    subjects = [subject1, subject2, subject3, subject4, subject5, subject6]
+    subject_dists = []
     
     # Validate grades
-    for i, grade in enumerate(subjects, 1):
-        if grade not in range(1, 8):
-            await interaction.response.send_message(f"❌ Subject {i} grade must be between 1 and 7.", ephemeral=True)
+    for i, grade in enumerate([subject1, subject2, subject3, subject4, subject5, subject6], 1):
+        try:
+            subject_dists.append(parse_grade_distribution(grade, 1, 7))
+        except ValueError:
+            await interaction.response.send_message(f"❌ Subject {i} grade must be between 1 and 7 (e.g. `5`, `5-6` or `5:0.3,6:0.7`).", ephemeral=True)
             return
     
-    if tok_ee_bonus not in range(0, 4):
+    try:
+        bonus_dist = parse_grade_distribution(tok_ee_bonus, 0, 3)
+    except ValueError:
         await interaction.response.send_message("❌ TOK/EE bonus points must be between 0 and 3.", ephemeral=True)
         return
     
+    if any(len(dist) > 1 for dist in subject_dists + [bonus_dist]):
+        await interaction.response.send_message(embed=build_total_distribution_embed(subject_dists, bonus_dist))
+        return
+    
+    subjects = [next(iter(dist)) for dist in subject_dists]
+    tok_ee_bonus = next(iter(bonus_dist))
     total_score = sum(subjects) + tok_ee_bonus
     subject_total = sum(subjects)
     
@@ -871,6 +1821,112 @@ async def calculate_total(interaction: discord.Interaction,
     
     await interaction.response.send_message(embed=embed)
 
+def build_total_distribution_embed(subject_dists, bonus_dist):
+    """Build the /calculate_total reply when some grades are uncertain"""
+    totals, awarded = diploma_distribution(subject_dists, bonus_dist)
+    expected = sum(total * p for total, p in totals.items())
+    likeliest = max(totals, key=totals.get)
+    
+    embed = discord.Embed(
+        title="🎓 IB Diploma Score Calculator",
+        description=f"**Chance of Diploma:** {awarded:.1%}",
+        color=discord.Color.green() if awarded >= 0.5 else discord.Color.red()
+    )
+    
+    def describe(dist):
+        return "/".join(str(g) for g in sorted(dist)) if len(dist) > 1 else str(next(iter(dist)))
+    
+    subjects_text = " + ".join(describe(dist) for dist in subject_dists)
+    embed.add_field(
+        name="Score Breakdown:",
+        value=f"**Subjects:** {subjects_text}\n**TOK/EE Bonus:** {describe(bonus_dist)}\n"
+              f"**Total Score:** {min(totals)}-{max(totals)}/45 (expected {expected:.1f}, most likely {likeliest})",
+        inline=False
+    )
+    
+    # Skip totals that are practically impossible to keep the field short
+    rows = [f"**{total}:** {p:.1%}" for total, p in sorted(totals.items(), reverse=True) if p >= 0.0005]
+    embed.add_field(name="Total Distribution:", value="\n".join(rows)[:1024], inline=False)
+    
+    embed.add_field(
+        name="💡 Note:",
+        value="Ranges count each grade as equally likely. Diploma rules: total ≥ 24 and every subject ≥ 3.",
+        inline=False
+    )
+    return embed
+
+@bot.tree.command(name="target", description="Find the raw marks you need for a target IB level or diploma total")
+@app_commands.describe(
+    subjects="Subjects separated by commas, optionally with a level each (e.g. chemistry_hl=6, math_sl=5)",
+    level="Target IB level for subjects without their own level (1-7)",
+    total="Target diploma total instead of per-subject levels (up to 45)",
+    tok_ee_bonus="TOK/EE bonus points you expect (0-3, only used with total)"
+)
+async def target(interaction: discord.Interaction, subjects: str, level: int = None,
+                 total: int = None, tok_ee_bonus: int = 0):
+    """Show the minimum raw mark needed per subject for a target level or total"""
+    targets = {}
+    for item in subjects.replace(';', ',').split(','):
+        item = item.strip().lower()
+        if not item:
+            continue
+        subject, _, subject_level = item.replace(':', '=').partition('=')
+        subject = subject.strip()
+        if subject not in CONVERSION_TABLES:
+            await interaction.response.send_message(f"❌ Unknown subject `{subject}`. Use `/list_subjects` to see the available subjects.", ephemeral=True)
+            return
+        try:
+            targets[subject] = int(subject_level) if subject_level.strip() else level
+        except ValueError:
+            await interaction.response.send_message(f"❌ Invalid level for `{subject}`.", ephemeral=True)
+            return
+
+    if not targets or len(targets) > 6:
+        await interaction.response.send_message("❌ Give between 1 and 6 subjects.", ephemeral=True)
+        return
+    if tok_ee_bonus not in range(0, 4):
+        await interaction.response.send_message("❌ TOK/EE bonus points must be between 0 and 3.", ephemeral=True)
+        return
+
+    if total is not None:
+        if total not in range(1, 46):
+            await interaction.response.send_message("❌ Target total must be between 1 and 45.", ephemeral=True)
+            return
+        # Subjects not listed are assumed to score the minimum passing level
+        unlisted = 6 - len(targets)
+        needed = max(total - tok_ee_bonus - 3 * unlisted, 0)
+        plan = solve_target_plan(list(targets), needed) if needed else {s: 3 for s in targets}
+        if plan is None:
+            await interaction.response.send_message(f"❌ A total of {total} isn't reachable with these subjects.", ephemeral=True)
+            return
+        title = f"🎯 Cheapest Plan for {total} Points"
+        description = f"**Subject points needed:** {needed}\n**TOK/EE Bonus:** {tok_ee_bonus}"
+        if unlisted:
+            description += f"\n*Assumes a 3 in each of the {unlisted} unlisted subject(s)*"
+    else:
+        for subject, subject_level in targets.items():
+            if subject_level is None or subject_level not in range(1, 8):
+                await interaction.response.send_message(f"❌ Give a target level (1-7) for `{subject}`, or a `total`.", ephemeral=True)
+                return
+        plan = targets
+        title = "🎯 Raw Marks Needed"
+        description = "Minimum raw mark for each target level"
+
+    embed = discord.Embed(title=title, description=description, color=discord.Color.blue())
+    rows = []
+    total_raw = 0
+    for subject, subject_level in plan.items():
+        raw_mark = min_raw_for_level(subject, subject_level)
+        if raw_mark is None:
+            rows.append(f"**{subject_display_name(subject)}:** Level {subject_level} isn't reachable")
+            continue
+        total_raw += raw_mark
+        rows.append(f"**{subject_display_name(subject)}:** Level {subject_level} → **{raw_mark}%** raw ({raw_to_converted(raw_mark, subject)}% converted)")
+    embed.add_field(name="Plan:", value="\n".join(rows), inline=False)
+    if total is not None:
+        embed.set_footer(text=f"Lowest combined raw marks: {total_raw} across {len(plan)} subject(s)")
+    await interaction.response.send_message(embed=embed)
+
 # Exam Countdown Commands
 @bot.tree.command(name="set_exam", description="Set an exam date for countdown")
 @app_commands.describe(
@@ -897,14 +1953,12 @@ async def set_exam(interaction: discord.Interaction, exam_name: str, date: str,
         await interaction.response.send_message("❌ Exam date must be in the future.", ephemeral=True)
         return
     
-    exam_dates[exam_name.lower()] = {
+    # Store the exam and save it to the database
+    store_exam(exam_name.lower(), {
         'name': exam_name,
         'datetime': exam_datetime,
         'set_by': interaction.user.id
-    }
-    
-    # Save exam dates to file
-    save_exam_dates()
+    })
     
     embed = discord.Embed(
         title="📅 Exam Date Set!",
@@ -925,6 +1979,7 @@ async def set_exam(interaction: discord.Interaction, exam_name: str, date: str,
 
 @bot.tree.command(name="exam_countdown", description="Show countdown to specific exam")
 @app_commands.describe(exam_name="Name of the exam (leave empty to show all)")
+@app_commands.autocomplete(exam_name=exam_name_autocomplete)
 async def exam_countdown(interaction: discord.Interaction, exam_name: str = None):
     """Show countdown to exam(s)"""
     try:
@@ -934,19 +1989,10 @@ async def exam_countdown(interaction: discord.Interaction, exam_name: str = None
         if exam_name:
             exam_key = exam_name.lower()
             if exam_key not in exam_dates:
-                available_exams = ", ".join([exam['name'] for exam in exam_dates.values()])
-                await interaction.response.send_message(f"❌ Exam '{exam_name}' not found. Available exams: {available_exams}", ephemeral=True)
+                await interaction.response.send_message(f"❌ Exam '{exam_name}' not found.{exam_suggestions(exam_name)}", ephemeral=True)
                 return
             exam_data = exam_dates[exam_key]
             exam_datetime = exam_data['datetime']
-            if isinstance(exam_datetime, str):
-                try:
-                    exam_datetime = datetime.fromisoformat(exam_datetime)
-                    exam_data['datetime'] = exam_datetime
-                except Exception as e:
-                    print(f"Warning: Could not parse datetime for exam '{exam_data['name']}': {e}")
-                    await interaction.response.send_message(f"❌ Could not parse date for exam '{exam_data['name']}'.", ephemeral=True)
-                    return
             time_until = exam_datetime - datetime.now()
             if time_until.total_seconds() <= 0:
                 embed = discord.Embed(
@@ -971,47 +2017,9 @@ async def exam_countdown(interaction: discord.Interaction, exam_name: str = None
             await interaction.response.send_message(embed=embed)
             return
         # --- Pagination for all exams ---
-        exams_sorted = sorted(exam_dates.values(), key=lambda x: x.get('datetime', datetime.max))
-        exams_per_page = 25
-        total_pages = (len(exams_sorted) + exams_per_page - 1) // exams_per_page
-        def make_embed(page_idx: int):
-            embed = discord.Embed(
-                title="📅 All Exam Countdowns",
-                color=discord.Color.orange()
-            )
-            start = page_idx * exams_per_page
-            end = start + exams_per_page
-            page_exams = exams_sorted[start:end]
-            for exam_data in page_exams:
-                if 'name' not in exam_data or 'datetime' not in exam_data:
-                    print(f"Warning: Malformed exam entry: {exam_data}")
-                    continue
-                exam_name = exam_data['name']
-                exam_datetime = exam_data['datetime']
-                if isinstance(exam_datetime, str):
-                    try:
-                        exam_datetime = datetime.fromisoformat(exam_datetime)
-                        exam_data['datetime'] = exam_datetime
-                    except Exception as e:
-                        print(f"Warning: Could not parse datetime for exam '{exam_name}': {e}")
-                        continue
-                time_until = exam_datetime - datetime.now()
-                if time_until.total_seconds() <= 0:
-                    time_text = "**EXAM TIME!**"
-                else:
-                    days = time_until.days
-                    time_text = f"{days} days remaining"
-                try:
-                    embed.add_field(
-                        name=exam_name,
-                        value=f"<t:{int(exam_datetime.timestamp())}:d>\n{time_text}",
-                        inline=True
-                    )
-                except Exception as e:
-                    print(f"Warning: Could not add field for exam '{exam_name}': {e}")
-                    continue
-            embed.set_footer(text=f"Page {page_idx+1} of {total_pages}")
-            return embed
+        # Pages come from the sorted exam index and are cached for the current minute
+        total_pages = exam_page_count()
+        make_embed = build_exam_page_embed
         class ExamPaginationView(discord.ui.View):
             def __init__(self, author_id, timeout=120):
                 super().__init__(timeout=timeout)
@@ -1061,8 +2069,56 @@ async def exam_countdown(interaction: discord.Interaction, exam_name: str = None
             except Exception:
                 pass
 
+def build_countdown_board_embed():
+    """The live board: the first page of /exam_countdown with a footer that doesn't change every minute"""
+    embed = build_exam_page_embed(0)
+    embed.title = "📅 Exam Countdown Board"
+    if not exams_by_time:
+        embed.description = "No exam dates have been set yet."
+    embed.set_footer(text=f"{len(exams_by_time)} exam(s) · Updates automatically")
+    return embed
+
+def board_content_hash(embed):
+    return hashlib.sha1(json.dumps(embed.to_dict(), sort_keys=True).encode('utf-8')).hexdigest()
+
+@bot.tree.command(name="countdown_board", description="Post a live exam countdown board that updates itself (admin only)")
+@app_commands.describe(channel="Channel to post the board in (defaults to this one)")
+async def countdown_board(interaction: discord.Interaction, channel: discord.TextChannel = None):
+    """Post this server's live countdown board and pin it, replacing any previous board"""
+    if not is_admin(interaction.user):
+        await interaction.response.send_message(f"❌ Only users with the '{admin_role_name(interaction.guild)}' role can post the countdown board.", ephemeral=True)
+        return
+    channel = channel or interaction.channel
+    embed = build_countdown_board_embed()
+    try:
+        message = await channel.send(embed=embed)
+    except discord.HTTPException as e:
+        await interaction.response.send_message(f"❌ Could not post in {channel.mention}: {e}", ephemeral=True)
+        return
+    try:
+        await message.pin(reason="Live exam countdown board")
+    except discord.HTTPException:
+        pass
+    set_guild_setting(interaction.guild.id, 'countdown_board', f"{channel.id}/{message.id}")
+    board_hashes[interaction.guild.id] = board_content_hash(embed)
+    await interaction.response.send_message(f"✅ Countdown board posted in {channel.mention}. It updates itself, no need to run `/exam_countdown`.", ephemeral=True)
+
+@bot.tree.command(name="remove_countdown_board", description="Stop updating the live exam countdown board (admin only)")
+async def remove_countdown_board(interaction: discord.Interaction):
+    """Forget this server's live board, the message itself is left as it is"""
+    if not is_admin(interaction.user):
+        await interaction.response.send_message(f"❌ Only users with the '{admin_role_name(interaction.guild)}' role can remove the countdown board.", ephemeral=True)
+        return
+    if not guild_setting(interaction.guild.id, 'countdown_board'):
+        await interaction.response.send_message("❌ This server doesn't have a countdown board.", ephemeral=True)
+        return
+    set_guild_setting(interaction.guild.id, 'countdown_board', None)
+    board_hashes.pop(interaction.guild.id, None)
+    await interaction.response.send_message("✅ The countdown board will no longer be updated.", ephemeral=True)
+
 @bot.tree.command(name="remove_exam", description="Remove an exam from countdown")
 @app_commands.describe(exam_name="Name of the exam to remove")
+@app_commands.autocomplete(exam_name=exam_name_autocomplete)
 async def remove_exam(interaction: discord.Interaction, exam_name: str):
     """Remove exam from countdown list"""
     if not interaction.user.guild_permissions.manage_channels:
@@ -1071,13 +2127,11 @@ async def remove_exam(interaction: discord.Interaction, exam_name: str):
     
     exam_key = exam_name.lower()
     if exam_key not in exam_dates:
-        await interaction.response.send_message(f"❌ Exam '{exam_name}' not found.", ephemeral=True)
+        await interaction.response.send_message(f"❌ Exam '{exam_name}' not found.{exam_suggestions(exam_name)}", ephemeral=True)
         return
     
-    removed_exam = exam_dates.pop(exam_key)
-    
-    # Save exam dates to file
-    save_exam_dates()
+    # Remove the exam and its database row
+    removed_exam = discard_exam(exam_key)
     
     embed = discord.Embed(
         title="🗑️ Exam Removed",
@@ -1087,11 +2141,70 @@ async def remove_exam(interaction: discord.Interaction, exam_name: str):
     
     await interaction.response.send_message(embed=embed)
 
+@bot.tree.command(name="import_exams", description="Import exam dates from a CSV or .ics file (admin only)")
+@app_commands.describe(file="CSV with name,date,time rows (YYYY-MM-DD, HH:MM) or an iCalendar .ics file")
+async def import_exams(interaction: discord.Interaction, file: discord.Attachment):
+    """Validate every row of an exam schedule file, then add all valid exams in one database write"""
+    if not is_admin(interaction.user):
+        await interaction.response.send_message(f"❌ Only users with the '{admin_role_name(interaction.guild)}' role can import exams.", ephemeral=True)
+        return
+    if file.size > 1024 * 1024:
+        await interaction.response.send_message("❌ The file is too large (1 MB max).", ephemeral=True)
+        return
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    try:
+        text = (await file.read()).decode('utf-8-sig')
+    except (discord.HTTPException, UnicodeDecodeError) as e:
+        await interaction.followup.send(f"❌ Could not read the file: {e}", ephemeral=True)
+        return
+
+    if file.filename.lower().endswith('.ics') or text.lstrip().upper().startswith('BEGIN:VCALENDAR'):
+        rows, errors = parse_ics(text)
+    else:
+        rows, errors = parse_exam_csv(text)
+    exams, errors = validate_exam_rows(rows, errors, datetime.now())
+
+    replaced = store_exams({
+        exam_key: {'name': name, 'datetime': exam_datetime, 'set_by': interaction.user.id}
+        for exam_key, (name, exam_datetime) in exams.items()
+    }) if exams else 0
+    # Write the whole import in one transaction now instead of waiting for the next flush
+    await persistence.flush()
+
+    embed = discord.Embed(
+        title="📥 Exams Imported",
+        description=f"**Imported:** {len(exams)} exam(s) ({replaced} replaced existing dates)\n**Skipped:** {len(errors)} row(s)",
+        color=discord.Color.green() if not errors else discord.Color.orange()
+    )
+    if errors:
+        error_lines = [f"Line {line}: {error}" for line, error in errors]
+        error_text = ""
+        for i, error_line in enumerate(error_lines):
+            more = f"\n...and {len(error_lines) - i} more"
+            if len(error_text) + len(error_line) + len(more) + 1 > 1024:
+                error_text += more
+                break
+            error_text += ("\n" if error_text else "") + error_line
+        embed.add_field(name="Problems:", value=error_text, inline=False)
+    await interaction.followup.send(embed=embed, ephemeral=True)
+
+@bot.tree.command(name="export_exams", description="Download the exam schedule as a calendar (.ics) file")
+async def export_exams(interaction: discord.Interaction):
+    """Send every exam as an iCalendar file that can be imported into calendar apps"""
+    if not exams_by_time:
+        await interaction.response.send_message("❌ No exam dates have been set yet.", ephemeral=True)
+        return
+    out = io.BytesIO()
+    write_ics(((exam_key, exam_dates[exam_key]['name'], exam_datetime) for exam_datetime, exam_key in exams_by_time), out)
+    out.seek(0)
+    await interaction.response.send_message(
+        f"📅 {len(exams_by_time)} exam(s). Open the file or import it into your calendar app.",
+        file=discord.File(out, filename="ib_exams.ics")
+    )
+
 @bot.tree.command(name="ib_boundaries", description="Show IB level boundaries for a subject")
 @app_commands.describe(subject="Choose the subject")
-@app_commands.choices(subject=[
-    app_commands.Choice(name="Math SL", value="math_sl"),
-    app_commands.Choice(name="Math HL", value="math_hl"),
+@app_commands.choices(subject=subject_choices()[:24] + [
     app_commands.Choice(name="General (Default)", value="default"),
 ])
 async def ib_boundaries(interaction: discord.Interaction, subject: str):
@@ -1101,6 +2214,10 @@ async def ib_boundaries(interaction: discord.Interaction, subject: str):
         await interaction.response.send_message(f"❌ Invalid subject. Available subjects: {available_subjects}", ephemeral=True)
         return
     
+    await interaction.response.send_message(embed=cached_embed(("ib_boundaries", subject), lambda: build_ib_boundaries_embed(subject)))
+
+def build_ib_boundaries_embed(subject):
+    """Build the /ib_boundaries reply"""
     boundaries = IB_LEVEL_BOUNDARIES[subject]
     
     embed = discord.Embed(
@@ -1127,51 +2244,228 @@ async def ib_boundaries(interaction: discord.Interaction, subject: str):
     )
     
     embed.set_footer(text="Based on WOSS IB standards")
-    
-    await interaction.response.send_message(embed=embed)
+    return embed
+
+@bot.tree.command(name="reload_tables", description="Reload subject conversion tables from disk (admin only)")
+@app_commands.describe(force="Reload every subject, not just the ones whose files changed")
+async def reload_tables(interaction: discord.Interaction, force: bool = False):
+    """Reload subject conversion tables without restarting the bot"""
+    if not is_admin(interaction.user):
+        await interaction.response.send_message(f"❌ Only users with the '{admin_role_name(interaction.guild)}' role can reload conversion tables.", ephemeral=True)
+        return
+
+    start = time.perf_counter()
+    reloaded, failed = reload_changed_tables(force=force)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    embed = discord.Embed(
+        title="🔄 Conversion Tables Reloaded",
+        description=f"Reloaded **{len(reloaded)}** subject(s) in **{elapsed_ms:.1f} ms**",
+        color=discord.Color.red() if failed else discord.Color.green()
+    )
+    if reloaded:
+        embed.add_field(name="Reloaded:", value=", ".join(f"`{s}`" for s in reloaded), inline=False)
+    if failed:
+        failed_text = "\n".join(f"`{s}`: {error}" for s, error in failed.items())
+        embed.add_field(name="Failed (kept previous table):", value=failed_text[:1024], inline=False)
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+@bot.tree.command(name="configure", description="Set this server's admin role and bot channels (Manage Server only)")
+@app_commands.describe(
+    admin_role="Role allowed to use admin commands (default: Admins)",
+    resources_channel="Channel where the resources list is posted",
+    exam_reminders_channel="Channel where upcoming exam reminders are posted",
+    reset="Setting to put back to its default"
+)
+@app_commands.choices(reset=[
+    app_commands.Choice(name="Admin Role", value="admin_role"),
+    app_commands.Choice(name="Resources Channel", value="resources_channel"),
+    app_commands.Choice(name="Exam Reminders Channel", value="exam_reminders_channel"),
+])
+async def configure(interaction: discord.Interaction, admin_role: discord.Role = None, resources_channel: discord.TextChannel = None,
+                    exam_reminders_channel: discord.TextChannel = None, reset: str = None):
+    """Change this server's settings, or show them when nothing is given"""
+    if not interaction.user.guild_permissions.manage_guild:
+        await interaction.response.send_message("❌ You need the 'Manage Server' permission to change bot settings.", ephemeral=True)
+        return
+    guild_id = interaction.guild.id
+    # Reset first so a setting given in the same command still applies
+    if reset is not None:
+        set_guild_setting(guild_id, reset, None)
+    if admin_role is not None:
+        # Stored by id so renaming the role doesn't lock admins out
+        set_guild_setting(guild_id, 'admin_role', admin_role.id)
+    if resources_channel is not None:
+        set_guild_setting(guild_id, 'resources_channel', resources_channel.id)
+    if exam_reminders_channel is not None:
+        set_guild_setting(guild_id, 'exam_reminders_channel', exam_reminders_channel.id)
+    channel = guild_resolver.channel(interaction.guild, guild_setting(guild_id, 'resources_channel'))
+    reminders_setting = guild_setting(guild_id, 'exam_reminders_channel')
+    reminders_channel = guild_resolver.channel(interaction.guild, reminders_setting) if reminders_setting else None
+    embed = discord.Embed(
+        title="⚙️ Server Settings",
+        description=f"**Admin Role:** {admin_role_name(interaction.guild)}\n"
+                    f"**Resources Channel:** {channel.mention if channel else 'not found'}\n"
+                    f"**Exam Reminders Channel:** {reminders_channel.mention if reminders_channel else 'not set'}",
+        color=discord.Color.blue()
+    )
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+@bot.tree.command(name="persistence_stats", description="Show database write queue stats (admin only)")
+async def persistence_stats(interaction: discord.Interaction):
+    """Show the write-behind queue depth and flush latency"""
+    if not is_admin(interaction.user):
+        await interaction.response.send_message(f"❌ Only users with the '{admin_role_name(interaction.guild)}' role can view persistence stats.", ephemeral=True)
+        return
+    stats = persistence.stats()
+    embed = discord.Embed(
+        title="💾 Persistence Stats",
+        description=f"**Queue Depth:** {stats['queue_depth']} row(s) waiting",
+        color=discord.Color.blue()
+    )
+    embed.add_field(
+        name="Flushes:",
+        value=f"**Count:** {stats['flushes']}\n**Rows Written:** {stats['rows_written']}\n**Failures:** {stats['failures']}",
+        inline=True
+    )
+    embed.add_field(
+        name="Flush Latency:",
+        value=f"**Last:** {stats['last_flush_ms']:.1f} ms\n**Average:** {stats['avg_flush_ms']:.1f} ms\n**Max:** {stats['max_flush_ms']:.1f} ms",
+        inline=True
+    )
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+@bot.tree.command(name="session_stats", description="Show lock in session memory use and expiry latency (admin only)")
+async def session_stats(interaction: discord.Interaction):
+    """Show the per-session memory footprint and how long expiry batches take"""
+    if not is_admin(interaction.user):
+        await interaction.response.send_message(f"❌ Only users with the '{admin_role_name(interaction.guild)}' role can view session stats.", ephemeral=True)
+        return
+    report = session_memory_report()
+    embed = discord.Embed(
+        title="🧠 Lock In Session Memory",
+        description=f"**Active Sessions:** {report['sessions']}\n**Total:** {report['total_bytes'] / 1024:.1f} KiB",
+        color=discord.Color.blue()
+    )
+    embed.add_field(
+        name="Per Session:",
+        value=f"**Now:** {report['record_bytes']:.0f} bytes\n**Old dict layout:** {report['dict_bytes']:.0f} bytes (plus the Member and Role it held)",
+        inline=False
+    )
+    batches = expiry_stats['batches']
+    avg_ms = expiry_stats['total_ms'] / batches if batches else 0.0
+    embed.add_field(
+        name="Expiry Batches:",
+        value=f"**Batches:** {batches} ({expiry_stats['sessions']} sessions, largest {expiry_stats['largest_batch']})\n"
+              f"**Last:** {expiry_stats['last_ms']:.0f} ms\n**Average:** {avg_ms:.0f} ms\n**Max:** {expiry_stats['max_ms']:.0f} ms\n"
+              f"**DMs Queued:** {completion_dms.qsize() if completion_dms else 0}",
+        inline=False
+    )
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+# /ahhhh role assignment: discord.py already waits on each rate limit bucket from the response
+# headers, the pool just caps how many requests are in flight and retries 429s it gives up on
+AHHHH_WORKERS = 8
+AHHHH_RETRIES = 3
+AHHHH_PROGRESS_INTERVAL = 2  # seconds between progress message edits
+
+async def add_role_with_retry(member, role, reason):
+    """Add role to member, backing off and retrying when Discord answers 429"""
+    for attempt in range(AHHHH_RETRIES + 1):
+        try:
+            await member.add_roles(role, reason=reason)
+            return
+        except (discord.RateLimited, discord.HTTPException) as e:
+            rate_limited = isinstance(e, discord.RateLimited) or e.status == 429
+            if not rate_limited or attempt == AHHHH_RETRIES:
+                raise
+            retry_after = getattr(e, 'retry_after', None) or 0
+            await asyncio.sleep(max(retry_after, 2 ** attempt))
+
+def ahhhh_progress_embed(done, total, failed):
+    return discord.Embed(
+        title="🔒 AHHHH! Locking everyone in...",
+        description=f"**Progress:** {done + failed}/{total}\n**Locked In:** {done}\n**Failed:** {failed}",
+        color=discord.Color.orange()
+    )
 
 @bot.tree.command(name="ahhhh", description="Give everyone the Locked In role for 480 minutes (admin only)")
 async def ahhhh(interaction: discord.Interaction):
     """Give everyone the Locked In role for 480 minutes (admin only)"""
     guild = interaction.guild
-    admin_role = discord.utils.get(guild.roles, name="Admins")
-    is_admin = admin_role in interaction.user.roles if admin_role else False
-    if not is_admin:
+    if not is_admin(interaction.user):
         embed = discord.Embed(
             title="❌ Permission Denied",
-            description="Only users with the 'Admins' role can use /AHHHH.",
+            description=f"Only users with the '{admin_role_name(guild)}' role can use /AHHHH.",
             color=discord.Color.red()
         )
         await interaction.response.send_message(embed=embed, ephemeral=True)
         return
     focus_role_name = f"🔒 Locked In (Deep)"
-    focus_role = discord.utils.get(guild.roles, name=focus_role_name)
+    focus_role = guild_resolver.role(guild, focus_role_name)
     if not focus_role:
         await interaction.response.send_message("❌ The 'Locked In (Deep)' role does not exist. Please ask an admin to create it.", ephemeral=True)
         return
+    # Role edits take far longer than the 3 second interaction window, so answer first and report progress
+    await interaction.response.defer(thinking=True)
+    members = [member for member in guild.members if not member.bot]
+    progress = await interaction.followup.send(embed=ahhhh_progress_embed(0, len(members), 0), wait=True)
+
     count = 0
-    for member in guild.members:
-        if not member.bot:
+    failures = Counter()
+    pending = iter(members)
+
+    async def worker():
+        nonlocal count
+        for member in pending:
             try:
-                await member.add_roles(focus_role, reason="AHHHH command used by admin")
-                # Set up a lock in session for 480 minutes for each user
-                end_time = datetime.now() + timedelta(minutes=480)
-                focus_sessions[member.id] = {
-                    'end_time': end_time,
-                    'role': focus_role,
-                    'mode': 'deep',
-                    'duration': 480,
-                    'user': member
-                }
-                count += 1
-            except Exception:
+                # Members who already have the role only need the session, not another API call
+                if focus_role not in member.roles:
+                    await add_role_with_retry(member, focus_role, "AHHHH command used by admin")
+            except discord.Forbidden:
+                failures["Missing permissions"] += 1
+                continue
+            except discord.RateLimited:
+                failures["Still rate limited after retries"] += 1
+                continue
+            except discord.HTTPException as e:
+                failures[f"HTTP {e.status}"] += 1
+                continue
+            except Exception as e:
+                # Network errors and the like only fail this member, the other workers carry on
+                print(f"Error giving the Locked In role to {member.id}: {e}")
+                failures[type(e).__name__] += 1
+                continue
+            # Set up a lock in session for 480 minutes for each user
+            add_focus_session(FocusSession.begin(member.id, guild.id, focus_role.id, 'deep', 480))
+            count += 1
+
+    async def report_progress():
+        while True:
+            await asyncio.sleep(AHHHH_PROGRESS_INTERVAL)
+            try:
+                await progress.edit(embed=ahhhh_progress_embed(count, len(members), sum(failures.values())))
+            except discord.HTTPException:
                 pass
-    embed = discord.Embed(
-        title="🔒 AHHHH! Everyone is now Locked In!",
-        description=f"Gave the Locked In role to {count} users for 480 minutes.",
-        color=discord.Color.red()
-    )
-    await interaction.response.send_message(embed=embed)
+
+    reporter = asyncio.create_task(report_progress())
+    try:
+        await asyncio.gather(*(worker() for _ in range(min(AHHHH_WORKERS, len(members)) or 1)))
+    finally:
+        reporter.cancel()
+        # Always replace the progress message with the final report, even if the command was interrupted
+        embed = discord.Embed(
+            title="🔒 AHHHH! Everyone is now Locked In!",
+            description=f"Gave the Locked In role to {count} users for 480 minutes.",
+            color=discord.Color.red()
+        )
+        if failures:
+            failed_text = "\n".join(f"{reason}: {n}" for reason, n in failures.most_common())
+            embed.add_field(name=f"Failed ({sum(failures.values())}):", value=failed_text[:1024], inline=False)
+        try:
+            await progress.edit(embed=embed)
+        except discord.HTTPException as e:
+            print(f"Error sending the /ahhhh report: {e}")
 
 @bot.tree.command(name="add_resource", description="Add a study resource to the resources channel")
 @app_commands.describe(
@@ -1199,15 +2493,16 @@ async def add_resource(interaction: discord.Interaction, url: str, description:
     if subject not in resources:
         resources[subject] = []
     
-    resources[subject].append({
+    resource = {
         'url': url,
         'description': description,
         'added_by': interaction.user.display_name,
         'added_at': datetime.now().isoformat()
-    })
+    }
+    resources[subject].append(resource)
     
-    # Save resources to file
-    save_resources()
+    # Save resource to the database
+    save_resource(subject, len(resources[subject]) - 1)
     
     # Update the resources message
     await update_resources_message(interaction.guild)
@@ -1236,11 +2531,11 @@ async def refresh_resources(interaction: discord.Interaction):
 
 async def update_resources_message(guild):
     """Update the resources message in the specified channel"""
-    channel_id = 1386860031512940565
-    channel = guild.get_channel(channel_id)
+    channel_setting = guild_setting(guild.id, 'resources_channel')
+    channel = guild_resolver.channel(guild, channel_setting)
     
     if not channel:
-        print(f"Warning: Resources channel {channel_id} not found")
+        print(f"Warning: Resources channel {channel_setting} not found in {guild.name}")
         return
     
     # Create the resources embed
@@ -1306,65 +2601,331 @@ async def update_resources_message(guild):
     except Exception as e:
         print(f"Error updating resources message: {e}")
 
-# Background Tasks
-@tasks.loop(minutes=1)
-async def check_focus_sessions():
-    """Check for expired lock in sessions"""
-    current_time = datetime.now()
-    expired_sessions = []
-    
-    for user_id, session_data in focus_sessions.items():
-        if current_time >= session_data['end_time']:
-            expired_sessions.append(user_id)
-    
-    for user_id in expired_sessions:
-        session_data = focus_sessions[user_id]
-        user = session_data['user']
-        
-        # Remove lock in session role
+# Lock in session expiry
+async def resolve_session(session_data):
+    """
+    Look up the member and role for a stored session, either may be None if they're gone
+    Other API errors are raised so the caller can try again later
+    """
+    guild = bot.get_guild(session_data.guild_id)
+    if guild is None:
+        return None, None
+    role = guild.get_role(session_data.role_id)
+    member = guild.get_member(session_data.user_id)
+    if member is None:
         try:
-            await user.remove_roles(session_data['role'], reason="Lock in session completed")
-        except:
-            pass
-        
-        # Send completion message
+            member = await guild.fetch_member(session_data.user_id)
+        except discord.NotFound:
+            member = None
+    return member, role
+
+# Expiry batches unlock members concurrently, completion DMs go through their own queue
+# so a slow or closed DM channel never holds up anyone's role removal
+EXPIRY_CONCURRENCY = 10
+EXPIRY_RETRY_SECONDS = 60  # wait before trying again when a role couldn't be removed
+DM_WORKERS = 4
+DM_DRAIN_TIMEOUT = 10  # seconds allowed at shutdown to send the DMs still queued
+# Created in start_completion_dms so the queue belongs to the loop the bot runs on
+completion_dms = None  # asyncio.Queue of (member, embed)
+dm_workers = []
+expiry_stats = {'batches': 0, 'sessions': 0, 'largest_batch': 0, 'last_ms': 0.0, 'max_ms': 0.0, 'total_ms': 0.0}
+
+def completion_embed(session_data, offline=False):
+    description = f"Your **{session_data.duration}-minute** lock in session has ended.\n\nGreat work! 🌟"
+    if offline:
+        description += "\n*(It ended while the bot was offline, sorry for the late message!)*"
+    embed = discord.Embed(
+        title="⏰ Lock In Session Complete!",
+        description=description,
+        color=discord.Color.green()
+    )
+    embed.set_footer(text="Ready for another session? Use /lockin to start again!")
+    return embed
+
+async def unlock_expired(session_data, semaphore, offline):
+    """
+    Remove the lock in role from one expired session's member, then forget the session and queue their DM
+    If the role can't be removed the session is kept and retried, so nobody is left locked in
+    """
+    async with semaphore:
+        try:
+            user, role = await resolve_session(session_data)
+            if user and role:
+                await user.remove_roles(role, reason="Lock in session completed")
+        except Exception as e:
+            print(f"Error removing lock in role from {session_data.user_id}, retrying in {EXPIRY_RETRY_SECONDS}s: {e}")
+            if focus_sessions.get(session_data.user_id) is session_data:
+                session_scheduler.schedule(session_data.user_id, time.time() + EXPIRY_RETRY_SECONDS)
+            return
+    # Only forget the session once the role is gone (it may have been ended by an admin meanwhile)
+    if focus_sessions.get(session_data.user_id) is not session_data:
+        return
+    remove_focus_session(session_data.user_id)
+    record_completed_session(session_data, time.time(), 'expired')
+    if user:
+        completion_dms.put_nowait((user, completion_embed(session_data, offline)))
+
+async def end_focus_sessions(user_ids, offline=False):
+    """Unlock the members of a batch of expired sessions concurrently, forgetting each session once unlocked"""
+    start = time.perf_counter()
+    ended = [focus_sessions[user_id] for user_id in user_ids if user_id in focus_sessions]
+    if not ended:
+        return
+    semaphore = asyncio.Semaphore(EXPIRY_CONCURRENCY)
+    await asyncio.gather(*(unlock_expired(s, semaphore, offline) for s in ended))
+
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    expiry_stats['batches'] += 1
+    expiry_stats['sessions'] += len(ended)
+    expiry_stats['largest_batch'] = max(expiry_stats['largest_batch'], len(ended))
+    expiry_stats['last_ms'] = elapsed_ms
+    expiry_stats['max_ms'] = max(expiry_stats['max_ms'], elapsed_ms)
+    expiry_stats['total_ms'] += elapsed_ms
+
+def start_completion_dms():
+    """Create the DM queue and its workers, must be called from the running event loop"""
+    global completion_dms
+    if completion_dms is None:
+        completion_dms = asyncio.Queue()
+    loop = asyncio.get_running_loop()
+    dm_workers[:] = [loop.create_task(completion_dm_worker()) for _ in range(DM_WORKERS)]
+
+async def stop_completion_dms():
+    """Give the workers a moment to send what's queued, then stop them"""
+    if completion_dms is None:
+        return
+    if not completion_dms.empty():
+        try:
+            await asyncio.wait_for(completion_dms.join(), timeout=DM_DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            print(f"Dropping {completion_dms.qsize()} completion DM(s) that couldn't be sent before shutdown")
+    for task in dm_workers:
+        task.cancel()
+    await asyncio.gather(*dm_workers, return_exceptions=True)
+    dm_workers.clear()
+
+async def completion_dm_worker():
+    """Send queued completion DMs, members with closed DMs are skipped"""
+    while True:
+        user, embed = await completion_dms.get()
         try:
-            embed = discord.Embed(
-                title="⏰ Lock In Session Complete!",
-                description=f"Your **{session_data['duration']}-minute** lock in session has ended.\n\nGreat work! 🌟",
-                color=discord.Color.green()
-            )
-            embed.set_footer(text="Ready for another session? Use /lockin to start again!")
             await user.send(embed=embed)
-        except:
+        except discord.HTTPException:
             pass
-        
-        # Remove from active sessions
-        del focus_sessions[user_id]
+        finally:
+            completion_dms.task_done()
 
-@tasks.loop(hours=24)
-async def update_exam_countdowns():
-    """Daily update for exam countdowns"""
-    # Remove past exams
-    current_time = datetime.now()
-    past_exams = []
-    
-    for exam_key, exam_data in exam_dates.items():
-        if exam_data['datetime'] <= current_time:
-            past_exams.append(exam_key)
-    
-    for exam_key in past_exams:
-        del exam_dates[exam_key]
-    
-    # Save exam dates to file if any were removed
-    if past_exams:
-        save_exam_dates()
+async def reconcile_focus_sessions():
+    """End every restored session that expired while the bot was offline, in one batch"""
+    now = time.time()
+    expired_sessions = [user_id for user_id, session_data in focus_sessions.items()
+                        if now >= session_data.end]
+    if not expired_sessions:
+        return
+    print(f"Ending {len(expired_sessions)} lock in session(s) that expired while offline")
+    await end_focus_sessions(expired_sessions, offline=True)
+    # Write all the deletions together rather than waiting for the next flush
+    await persistence.flush()
+
+async def expire_focus_sessions(user_ids):
+    """Called by session_scheduler with every session that just came due"""
+    now = time.time()
+    await end_focus_sessions([user_id for user_id in user_ids
+                              if user_id in focus_sessions and now >= focus_sessions[user_id].end])
+
+# Sleeps until the next session ends instead of scanning every session each minute
+session_scheduler = ExpiryScheduler(expire_focus_sessions)
+
+# Exam reminders
+async def post_exam_reminder(exam, offset):
+    """Post a reminder in every guild that has an exam reminders channel"""
+    exam_ts = int(exam['datetime'].timestamp())
+    embed = discord.Embed(
+        title="⏰ Exam Reminder",
+        description=f"**{exam['name']}** is in **{format_offset(offset)}**\n<t:{exam_ts}:F> (<t:{exam_ts}:R>)",
+        color=discord.Color.orange()
+    )
+    embed.set_footer(text="Good luck! 📚")
+    for guild_id, settings in list(guild_config.items()):
+        guild = bot.get_guild(guild_id)
+        if guild is None or not settings.get('exam_reminders_channel'):
+            continue
+        channel = guild_resolver.channel(guild, settings['exam_reminders_channel'])
+        if channel is None:
+            print(f"Warning: Exam reminders channel {settings['exam_reminders_channel']} not found in {guild.name}")
+            continue
+        try:
+            await channel.send(embed=embed)
+        except discord.HTTPException as e:
+            print(f"Error posting exam reminder in {guild.name}: {e}")
+
+async def fire_exam_events(keys):
+    """Called by exam_scheduler: post due reminders and remove exams that have started"""
+    for exam_key, offset in keys:
+        exam = exam_dates.get(exam_key)
+        if exam is None:
+            continue
+        if offset == 0:
+            discard_exam(exam_key)
+        else:
+            await post_exam_reminder(exam, offset)
+
+# One heap of (fire time, (exam_key, offset)) for every exam, sleeps until the next one is due
+exam_scheduler = ExpiryScheduler(fire_exam_events)
+
+# Background Tasks
+# Live countdown boards are edited on a fixed interval, so any number of exam changes between
+# two ticks cost one edit per board, and a board whose content hash hasn't changed isn't edited
+BOARD_UPDATE_SECONDS = 60
+board_hashes = {}  # guild_id -> content hash of what the board currently shows
+
+@tasks.loop(seconds=BOARD_UPDATE_SECONDS)
+async def update_countdown_boards():
+    """Edit every guild's live countdown board whose content changed"""
+    embed = None
+    for guild_id, settings in list(guild_config.items()):
+        board = settings.get('countdown_board')
+        if not board:
+            continue
+        if embed is None:
+            embed = build_countdown_board_embed()
+            content_hash = board_content_hash(embed)
+        if board_hashes.get(guild_id) == content_hash:
+            continue
+        guild = bot.get_guild(guild_id)
+        channel_id, message_id = (int(part) for part in board.split('/'))
+        channel = guild_resolver.channel(guild, channel_id) if guild else None
+        if channel is None:
+            continue
+        try:
+            await channel.get_partial_message(message_id).edit(embed=embed)
+            board_hashes[guild_id] = content_hash
+        except discord.NotFound:
+            # The board was deleted, stop updating it
+            print(f"Countdown board in {guild.name} was deleted, forgetting it")
+            set_guild_setting(guild_id, 'countdown_board', None)
+            board_hashes.pop(guild_id, None)
+        except discord.HTTPException as e:
+            print(f"Error updating countdown board in {guild.name}: {e}")
+
+@tasks.loop(seconds=30)
+async def watch_conversion_tables():
+    """Hot reload subject tables whose JSON files changed"""
+    reloaded, failed = reload_changed_tables()
+    if reloaded:
+        print(f"Reloaded conversion tables: {', '.join(reloaded)}")
+    for subject, error in failed.items():
+        print(f"Warning: Could not reload conversion table for {subject}: {error}")
+
+
+# Command-line tools
+def convert_csv(in_file, out_file, chunk_size=5000):
+    """
+    Stream a CSV of (student, subject, raw) rows through convert_batch chunk by chunk
+    Writes (student, subject, raw, converted, ib_level) rows and returns (converted, skipped) counts
+    """
+    reader = csv.reader(in_file)
+    writer = csv.writer(out_file)
+    writer.writerow(["student", "subject", "raw", "converted", "ib_level"])
+    converted_count = 0
+    skipped = 0
+
+    def flush(chunk):
+        # Group the chunk by subject so each subject is converted in one vectorized pass
+        by_subject = {}
+        for i, (_, subject, raw_mark) in enumerate(chunk):
+            by_subject.setdefault(subject, []).append(i)
+        results = [None] * len(chunk)
+        for subject, rows in by_subject.items():
+            converted, levels = convert_batch([chunk[i][2] for i in rows], subject)
+            for j, i in enumerate(rows):
+                results[i] = (int(converted[j]), int(levels[j]))
+        for (student, subject, raw_mark), (converted, level) in zip(chunk, results):
+            writer.writerow([student, subject, raw_mark, converted, level])
+
+    chunk = []
+    for line_no, row in enumerate(reader, 1):
+        if len(row) < 3:
+            skipped += 1
+            continue
+        student, subject, raw_mark = (cell.strip() for cell in row[:3])
+        try:
+            raw_mark = int(raw_mark)
+        except ValueError:
+            # Header row or bad mark
+            if line_no > 1:
+                print(f"Warning: Skipping line {line_no}, invalid raw mark '{raw_mark}'", file=sys.stderr)
+                skipped += 1
+            continue
+        if subject not in CONVERSION_TABLES or raw_mark not in range(0, 101):
+            print(f"Warning: Skipping line {line_no}, unknown subject or mark out of range", file=sys.stderr)
+            skipped += 1
+            continue
+        chunk.append((student, subject, raw_mark))
+        if len(chunk) >= chunk_size:
+            flush(chunk)
+            converted_count += len(chunk)
+            chunk = []
+    if chunk:
+        flush(chunk)
+        converted_count += len(chunk)
+    return converted_count, skipped
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="WOSS IB Discord bot")
+    parser.add_argument("--convert-csv", metavar="FILE",
+                        help="Convert a CSV of student,subject,raw rows instead of running the bot ('-' for stdin)")
+    parser.add_argument("--output", metavar="FILE", default="-",
+                        help="Where to write converted rows (default: stdout)")
+    parser.add_argument("--chunk-size", type=int, default=5000,
+                        help="Rows converted per batch when streaming a CSV")
+    parser.add_argument("--import-master", metavar="CSV", nargs="?", const=MASTER_CSV_FILE,
+                        help="Rebuild subject tables from the master conversions CSV, only for changed subjects")
+    parser.add_argument("--force", action="store_true",
+                        help="With --import-master, rebuild every subject even if unchanged")
+    parser.add_argument("--pack-tables", action="store_true",
+                        help="Pack the subject tables into data/conversions.bin for faster startup")
+    args = parser.parse_args(argv)
+
+    if args.pack_tables:
+        packed = pack_conversion_tables()
+        print(f"Packed {len(packed)} subject table(s) into {PACKED_TABLES_FILE}")
+        return
+
+    if args.import_master:
+        updated, unchanged, failed = import_master_csv(args.import_master, force=args.force)
+        print(f"Updated {len(updated)} subject(s): {', '.join(updated) or 'none'}")
+        print(f"Unchanged: {len(unchanged)}")
+        for subject, error in failed.items():
+            print(f"❌ {subject}: {error} (kept existing table)")
+        if updated and os.path.exists(PACKED_TABLES_FILE):
+            pack_conversion_tables()
+            print("Repacked conversion tables")
+        return
+
+    if args.convert_csv:
+        in_file = sys.stdin if args.convert_csv == "-" else open(args.convert_csv, newline='')
+        out_file = sys.stdout if args.output == "-" else open(args.output, 'w', newline='')
+        try:
+            converted, skipped = convert_csv(in_file, out_file, max(args.chunk_size, 1))
+        finally:
+            if in_file is not sys.stdin:
+                in_file.close()
+            if out_file is not sys.stdout:
+                out_file.close()
+        print(f"Converted {converted} marks ({skipped} rows skipped)", file=sys.stderr)
+        return
 
-if __name__ == "__main__":
     # Make sure to set your bot token in .env file
     token = os.getenv('DISCORD_TOKEN')
     if not token:
         print("Error: DISCORD_TOKEN not found in environment variables!")
         print("Please create a .env file with your bot token.")
     else:
-        bot.run(token)
\ No newline at end of file
+        open_database()
+        bot.run(token)
+        # Anything queued after the bot closed
+        persistence.flush_sync()
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,142 @@
+"""Prefix trie and token index over names, used for exam name autocomplete"""
+import difflib
+import heapq
+import re
+
+TOKEN_RE = re.compile(r"[a-z]+|\d+")
+
+def tokenize(text):
+    """Lowercase words and numbers, "Physics SL P1" -> ['physics', 'sl', 'p', '1']"""
+    return TOKEN_RE.findall(text.lower())
+
+class TrieNode:
+    __slots__ = ('children', 'keys')
+
+    def __init__(self):
+        self.children = {}
+        self.keys = set()  # every key whose word passes through this node
+
+class Trie:
+    """Maps each prefix of the inserted words to the keys they were inserted with"""
+
+    def __init__(self):
+        self.root = TrieNode()
+
+    def insert(self, word, key):
+        node = self.root
+        for ch in word:
+            node = node.children.setdefault(ch, TrieNode())
+            node.keys.add(key)
+
+    def remove(self, word, key):
+        node = self.root
+        path = []
+        for ch in word:
+            child = node.children.get(ch)
+            if child is None:
+                return
+            path.append((node, ch, child))
+            child.keys.discard(key)
+            node = child
+        # Prune branches nothing passes through anymore
+        for parent, ch, child in reversed(path):
+            if child.keys:
+                break
+            del parent.children[ch]
+
+    def lookup(self, prefix):
+        """Keys of every word starting with prefix"""
+        node = self.root
+        for ch in prefix:
+            node = node.children.get(ch)
+            if node is None:
+                return set()
+        return node.keys
+
+class NameIndex:
+    """
+    Searchable names: a trie over whole names for "starts with" matches, a trie over the
+    words in each name for matches in any order, and close matches on the word list for typos
+    """
+
+    def __init__(self):
+        self.names = {}      # key -> lowercased name
+        self.words = {}      # word -> set of keys using it
+        self.name_trie = Trie()
+        self.word_trie = Trie()
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, key, name):
+        if key in self.names:
+            self.remove(key)
+        name = name.lower()
+        self.names[key] = name
+        self.name_trie.insert(name, key)
+        for word in set(tokenize(name)):
+            self.words.setdefault(word, set()).add(key)
+            self.word_trie.insert(word, key)
+
+    def remove(self, key):
+        name = self.names.pop(key, None)
+        if name is None:
+            return
+        self.name_trie.remove(name, key)
+        for word in set(tokenize(name)):
+            self.word_trie.remove(word, key)
+            keys = self.words[word]
+            keys.discard(key)
+            if not keys:
+                del self.words[word]
+
+    def _first(self, keys, limit, exclude):
+        return heapq.nsmallest(limit, (k for k in keys if k not in exclude), key=self.names.__getitem__)
+
+    def search(self, query, limit=25):
+        """
+        Up to limit keys matching query, best first:
+        names starting with query, then names containing every query word as a word prefix,
+        then names matching the most query words allowing for typos
+        """
+        query = query.lower().strip()
+        results = []
+        seen = set()
+
+        def take(keys):
+            for key in keys:
+                if len(results) >= limit:
+                    break
+                if key not in seen:
+                    seen.add(key)
+                    results.append(key)
+
+        take(self._first(self.name_trie.lookup(query), limit, seen))
+        words = tokenize(query)
+        if not words or len(results) >= limit:
+            return results
+
+        matches = [self.word_trie.lookup(word) for word in words]
+        if all(matches):
+            take(self._first(set.intersection(*sorted(matches, key=len)), limit - len(results), seen))
+        if len(results) >= limit:
+            return results
+
+        # Typos: a word also matches names using any close word, rank by how many query words matched
+        scores = {}
+        for word, keys in zip(words, matches):
+            keys = set(keys)
+            if len(word) > 2:
+                for close in difflib.get_close_matches(word, self.words, n=3, cutoff=0.7):
+                    keys |= self.words[close]
+            for key in keys:
+                if key not in seen:
+                    scores[key] = scores.get(key, 0) + 1
+        if scores:
+            # Each result must match all but one of the query words (or all of them for short queries)
+            needed = max(1, len(words) - 1) if len(words) > 2 else len(words)
+            ranked = heapq.nsmallest(limit - len(results),
+                                     (k for k, score in scores.items() if score >= needed),
+                                     key=lambda k: (-scores[k], self.names[k]))
+            take(ranked)
+        return results
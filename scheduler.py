@@ -0,0 +1,102 @@
+"""Min-heap scheduler that sleeps until the next entry is due"""
+import asyncio
+import heapq
+import itertools
+import time
+
+class ExpiryScheduler:
+    """
+    Keeps one entry per key in a min-heap ordered by due time (unix timestamp)
+    and calls callback(keys) with every key that has come due, in a single batch.
+    Cancelled entries are only marked dead and dropped lazily when they reach the top.
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+        self._heap = []      # [due, seq, key, alive]
+        self._entries = {}   # key -> live heap entry
+        self._seq = itertools.count()
+        self._wakeup = None
+        self._task = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def schedule(self, key, due):
+        """Schedule key at due, replacing any earlier schedule for it"""
+        self.cancel(key)
+        entry = [due, next(self._seq), key, True]
+        self._entries[key] = entry
+        heapq.heappush(self._heap, entry)
+        # Only an entry that became the next one due changes how long the loop should sleep
+        if self._heap[0] is entry and self._wakeup is not None:
+            self._wakeup.set()
+
+    def cancel(self, key):
+        """Forget key if it's scheduled"""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        entry[3] = False
+        # Rebuild once most of the heap is dead so cancelled entries can't pile up
+        if len(self._heap) > 64 and len(self._heap) > 2 * len(self._entries):
+            self._heap = [e for e in self._heap if e[3]]
+            heapq.heapify(self._heap)
+
+    def next_due(self):
+        """Due time of the next live entry, or None"""
+        self._drop_dead()
+        return self._heap[0][0] if self._heap else None
+
+    def _drop_dead(self):
+        while self._heap and not self._heap[0][3]:
+            heapq.heappop(self._heap)
+
+    def _pop_due(self, now):
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            entry = heapq.heappop(self._heap)
+            if entry[3]:
+                del self._entries[entry[2]]
+                due.append(entry[2])
+        return due
+
+    def start(self):
+        """Start the scheduler loop, must be called from the running event loop"""
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            next_due = self.next_due()
+            if next_due is None:
+                await self._wakeup.wait()
+                continue
+            delay = next_due - time.time()
+            if delay > 0:
+                # Sleep until the next entry is due, or until an earlier one is scheduled
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            keys = self._pop_due(time.time())
+            if keys:
+                try:
+                    await self.callback(keys)
+                except Exception as e:
+                    print(f"Error in scheduler callback: {e}")
@@ -0,0 +1,379 @@
+"""SQLite persistence for resources, exam dates and lock in sessions"""
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS resources (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    subject TEXT NOT NULL,
+    url TEXT NOT NULL,
+    description TEXT NOT NULL,
+    added_by TEXT NOT NULL,
+    added_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS resources_by_subject ON resources (subject, id);
+
+CREATE TABLE IF NOT EXISTS exams (
+    exam_key TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    datetime TEXT NOT NULL,
+    set_by INTEGER
+);
+CREATE INDEX IF NOT EXISTS exams_by_datetime ON exams (datetime);
+
+CREATE TABLE IF NOT EXISTS focus_sessions (
+    user_id INTEGER PRIMARY KEY,
+    guild_id INTEGER NOT NULL,
+    role_id INTEGER NOT NULL,
+    mode TEXT NOT NULL,
+    start_time INTEGER NOT NULL,
+    end_time INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS focus_sessions_by_end ON focus_sessions (end_time);
+
+CREATE TABLE IF NOT EXISTS session_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    guild_id INTEGER NOT NULL,
+    mode TEXT NOT NULL,
+    start_time INTEGER NOT NULL,
+    end_time INTEGER NOT NULL,
+    ended_by TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS session_history_by_user ON session_history (user_id, end_time);
+
+-- Running totals per period ('all', 'day:YYYY-MM-DD', 'week:YYYY-Www'), mode '' is all modes together
+CREATE TABLE IF NOT EXISTS session_totals (
+    guild_id INTEGER NOT NULL,
+    period TEXT NOT NULL,
+    user_id INTEGER NOT NULL,
+    mode TEXT NOT NULL,
+    minutes INTEGER NOT NULL,
+    sessions INTEGER NOT NULL,
+    PRIMARY KEY (guild_id, period, user_id, mode)
+);
+
+CREATE TABLE IF NOT EXISTS guild_config (
+    guild_id INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (guild_id, key)
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+class Storage:
+    """Small wrapper around the bot's SQLite database (WAL mode, one row per mutation)"""
+
+    def __init__(self, path):
+        self.path = path
+        # Autocommit: every mutation below is its own single-row transaction unless run through apply()
+        # Writes come from the WriteBehind worker thread, which is the only writer once the bot is running
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def apply(self, ops):
+        """Run [(method name, args), ...] in a single transaction"""
+        with self.conn:
+            self.conn.execute("BEGIN")
+            for name, args in ops:
+                getattr(self, name)(*args)
+
+    # --- Resources ---
+    def load_resources(self):
+        """Return {subject: [resource, ...]} in the order resources were added"""
+        resources = {}
+        for row in self.conn.execute("SELECT subject, url, description, added_by, added_at FROM resources ORDER BY id"):
+            resources.setdefault(row['subject'], []).append({
+                'url': row['url'],
+                'description': row['description'],
+                'added_by': row['added_by'],
+                'added_at': row['added_at']
+            })
+        return resources
+
+    def add_resource(self, subject, resource):
+        self.conn.execute(
+            "INSERT INTO resources (subject, url, description, added_by, added_at) VALUES (?, ?, ?, ?, ?)",
+            (subject, resource['url'], resource['description'], resource['added_by'], resource['added_at'])
+        )
+
+    # --- Exams ---
+    def load_exam_dates(self):
+        """Return {exam_key: {'name', 'datetime', 'set_by'}} sorted by exam time"""
+        return {
+            row['exam_key']: {
+                'name': row['name'],
+                'datetime': datetime.fromisoformat(row['datetime']),
+                'set_by': row['set_by']
+            }
+            for row in self.conn.execute("SELECT exam_key, name, datetime, set_by FROM exams ORDER BY datetime")
+        }
+
+    def set_exam(self, exam_key, exam):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO exams (exam_key, name, datetime, set_by) VALUES (?, ?, ?, ?)",
+            (exam_key, exam['name'], exam['datetime'].isoformat(), exam['set_by'])
+        )
+
+    def remove_exam(self, exam_key):
+        self.conn.execute("DELETE FROM exams WHERE exam_key = ?", (exam_key,))
+
+    # --- Lock in sessions ---
+    def load_focus_sessions(self):
+        """Return every stored session as a dict of ids and unix timestamps"""
+        return [dict(row) for row in self.conn.execute(
+            "SELECT user_id, guild_id, role_id, mode, start_time, end_time FROM focus_sessions ORDER BY end_time"
+        )]
+
+    def save_focus_session(self, user_id, guild_id, role_id, mode, start_time, end_time):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO focus_sessions (user_id, guild_id, role_id, mode, start_time, end_time) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (user_id, guild_id, role_id, mode, int(start_time), int(end_time))
+        )
+
+    def delete_focus_session(self, user_id):
+        self.conn.execute("DELETE FROM focus_sessions WHERE user_id = ?", (user_id,))
+
+    # --- Lock in history ---
+    def add_session_history(self, user_id, guild_id, mode, start_time, end_time, ended_by):
+        self.conn.execute(
+            "INSERT INTO session_history (user_id, guild_id, mode, start_time, end_time, ended_by) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (user_id, guild_id, mode, int(start_time), int(end_time), ended_by)
+        )
+
+    def add_session_total(self, guild_id, period, user_id, mode, minutes, sessions):
+        """Add to a running total, creating it if needed"""
+        key = (guild_id, period, user_id, mode)
+        self.conn.execute(
+            "INSERT OR IGNORE INTO session_totals (guild_id, period, user_id, mode, minutes, sessions) "
+            "VALUES (?, ?, ?, ?, 0, 0)",
+            key
+        )
+        self.conn.execute(
+            "UPDATE session_totals SET minutes = minutes + ?, sessions = sessions + ? "
+            "WHERE guild_id = ? AND period = ? AND user_id = ? AND mode = ?",
+            (minutes, sessions) + key
+        )
+
+    def load_session_totals(self, periods):
+        """Return the running totals rows for the given periods"""
+        placeholders = ", ".join("?" * len(periods))
+        return [dict(row) for row in self.conn.execute(
+            "SELECT guild_id, period, user_id, mode, minutes, sessions FROM session_totals "
+            f"WHERE period IN ({placeholders})",
+            list(periods)
+        )]
+
+    # --- Guild settings ---
+    def load_guild_config(self):
+        """Return {guild_id: {key: value}}"""
+        config = {}
+        for row in self.conn.execute("SELECT guild_id, key, value FROM guild_config"):
+            config.setdefault(row['guild_id'], {})[row['key']] = row['value']
+        return config
+
+    def set_guild_config(self, guild_id, key, value):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO guild_config (guild_id, key, value) VALUES (?, ?, ?)",
+            (guild_id, key, value)
+        )
+
+    def delete_guild_config(self, guild_id, key):
+        self.conn.execute("DELETE FROM guild_config WHERE guild_id = ? AND key = ?", (guild_id, key))
+
+    # --- Migration ---
+    def migrate_json(self, resources_file, exam_dates_file):
+        """
+        One-time import of the old resources.json and exam_dates.json files
+        Returns (resources, exams) imported, (0, 0) if the migration already ran
+        """
+        if self.conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+            return 0, 0
+
+        resource_rows = []
+        if os.path.exists(resources_file):
+            with open(resources_file, 'r') as f:
+                for subject, subject_resources in json.load(f).items():
+                    for r in subject_resources:
+                        resource_rows.append((subject, r['url'], r['description'], r['added_by'], r['added_at']))
+        exam_rows = []
+        if os.path.exists(exam_dates_file):
+            with open(exam_dates_file, 'r') as f:
+                for exam_key, data in json.load(f).items():
+                    exam_rows.append((exam_key, data['name'], data['datetime'], data['set_by']))
+
+        # All or nothing, so a failed migration is simply retried on the next start
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.executemany(
+                "INSERT INTO resources (subject, url, description, added_by, added_at) VALUES (?, ?, ?, ?, ?)",
+                resource_rows
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO exams (exam_key, name, datetime, set_by) VALUES (?, ?, ?, ?)",
+                exam_rows
+            )
+            self.conn.execute("INSERT INTO meta (key, value) VALUES ('json_migrated', ?)", (datetime.now().isoformat(),))
+        return len(resource_rows), len(exam_rows)
+
+class WriteBehind:
+    """
+    Write-behind queue in front of Storage so saves never block the event loop
+    Mutations only mark a (kind, key) dirty. A background task waits a moment so bursts merge,
+    snapshots every dirty key into row writes using serializers[kind](key), and applies them
+    in one transaction on a worker thread. Insert-only rows (e.g. history) are queued with append().
+    """
+
+    def __init__(self, storage, serializers, delay=0.5, max_retry_delay=60):
+        self.storage = storage
+        self.serializers = serializers
+        self.delay = delay
+        self.max_retry_delay = max_retry_delay
+        self._retry_delay = delay
+        self._retry = None  # timer that wakes the flusher after a failed write
+        self.dirty = {}  # used as an ordered set of (kind, key)
+        self.appends = []  # (method name, args) written as is
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._wakeup = None
+        self._lock = None
+        self._task = None
+        # Stats, see stats()
+        self.flushes = 0
+        self.rows_written = 0
+        self.failures = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    def mark(self, kind, key):
+        """Mark a row dirty, it will be written on the next flush"""
+        self.dirty[(kind, key)] = None
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def append(self, name, args):
+        """Queue an insert-only row write, it will be written on the next flush"""
+        self.appends.append((name, args))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def start(self):
+        """Start the background flusher, must be called from the running event loop"""
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._lock = asyncio.Lock()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        if self.dirty or self.appends:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            # Let a burst of writes pile up so it becomes one transaction
+            await asyncio.sleep(self.delay)
+            self._wakeup.clear()
+            await self.flush()
+
+    def _snapshot(self):
+        """Turn the dirty keys into row writes, reading the current in-memory state"""
+        keys, self.dirty = list(self.dirty), {}
+        appends, self.appends = self.appends, []
+        ops = []
+        for kind, key in keys:
+            try:
+                ops.append(self.serializers[kind](key))
+            except Exception as e:
+                print(f"Error serializing {kind} {key!r}: {e}")
+        return keys, appends, ops + appends
+
+    async def flush(self):
+        """Write everything that is dirty now"""
+        async with self._lock:
+            keys, appends, ops = self._snapshot()
+            if not ops:
+                return
+            start = time.perf_counter()
+            try:
+                await asyncio.get_running_loop().run_in_executor(self.executor, self.storage.apply, ops)
+            except Exception as e:
+                print(f"Error writing to database, will retry in {self._retry_delay:g}s: {e}")
+                self.failures += 1
+                # Serializers read the latest state, so retrying the keys is always correct
+                for key in keys:
+                    self.dirty.setdefault(key, None)
+                self.appends[:0] = appends
+                self._schedule_retry()
+                return
+            self._retry_delay = self.delay
+            self._record_flush(start, len(ops))
+
+    def _schedule_retry(self):
+        """Wake the flusher again after a delay that doubles with each failure in a row"""
+        if self._wakeup is None:
+            return
+        if self._retry is not None:
+            self._retry.cancel()
+        self._retry = asyncio.get_running_loop().call_later(self._retry_delay, self._wakeup.set)
+        self._retry_delay = min(self._retry_delay * 2, self.max_retry_delay)
+
+    def flush_sync(self):
+        """Flush from outside the event loop (e.g. after the bot has stopped)"""
+        keys, appends, ops = self._snapshot()
+        if ops:
+            start = time.perf_counter()
+            self.storage.apply(ops)
+            self._record_flush(start, len(ops))
+
+    def _record_flush(self, start, rows):
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.flushes += 1
+        self.rows_written += rows
+        self.last_flush_ms = elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        self.total_flush_ms += elapsed_ms
+
+    async def close(self):
+        """Stop the flusher and write whatever is still pending"""
+        if self._retry is not None:
+            self._retry.cancel()
+            self._retry = None
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._lock is not None:
+            await self.flush()
+        self.executor.shutdown(wait=True)
+
+    def stats(self):
+        """Queue depth and flush latency figures"""
+        return {
+            'queue_depth': len(self.dirty) + len(self.appends),
+            'flushes': self.flushes,
+            'rows_written': self.rows_written,
+            'failures': self.failures,
+            'last_flush_ms': self.last_flush_ms,
+            'max_flush_ms': self.max_flush_ms,
+            'avg_flush_ms': self.total_flush_ms / self.flushes if self.flushes else 0.0,
+        }